@@ -105,6 +105,7 @@
                  pythonPackages.pydantic-settings
                  pythonPackages.pandas
                  pythonPackages.dash
+                 pythonPackages.pytest
                ]);
       in
         {
@@ -17,13 +17,15 @@ from watchdog.observers.polling import PollingObserver as Observer
 
 from metrics.command_processor import MetricCommand, CommandProcessor
 from metrics.metrics_store import MetricsStore
+from minster.checkpoint import Checkpointer
 from minster.classifiers.classifier import Classifier
 from minster.classifiers.classifier_factory import ClassifierFactory
 from minster.config import ExperimentSettings, SequencerSettings
 from minster.experiment_manager import ExperimentManager
-from minster.fastq_handler import FastqHandler
+from minster.fastq_handler import FASTQ_SUFFIXES, FastqHandler
 from minster.fragment_collection import FragmentCollection
 from minster.read_processor import ReadProcessor
+from minster.reference_catalog import ReferenceCatalog
 from minster.read_until_regulator import ReadUntilRegulator
 from minster.strata_balancer import StrataBalancer
 from simulation.fake_protocol_service import FakeProtocolService
@@ -77,6 +79,7 @@ def start_basecalled_monitoring(
         protocol_service: Union[ProtocolService, FakeProtocolService],
         observer: Observer,
         read_processor: ReadProcessor,
+        resume: bool
 ) -> None:
     exp_manager = ExperimentManager(
         protocol_service,
@@ -88,12 +91,22 @@ def start_basecalled_monitoring(
     while not watch_dir.exists():
         time.sleep(1)
 
+    # files written while the previous run was down, listed before the observer starts so
+    # that none is missed; files that are listed and observed as well are only parsed once
+    existing_files: list[str] = []
+    if resume:
+        existing_files = [
+            str(fastq_path) for fastq_path in sorted(watch_dir.rglob("*"))
+            if fastq_path.is_file() and fastq_path.name.endswith(FASTQ_SUFFIXES)
+        ]
+
     observer.schedule(
         event_handler,
         path=str(watch_dir),
         recursive=True
     )
     observer.start()
+    event_handler.ingest(existing_files)
 
     try:
         while observer.is_alive():
@@ -119,10 +132,18 @@ def main() -> None:
         required=False,
         help="Path to the dir where the Icarust simulator writes data"
     )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Restore the state of the last checkpoint and skip the FASTQ files it already includes"
+    )
     args = parser.parse_args()
 
     ExperimentSettings.set_toml_file(Path(args.config))
     experiment_settings = ExperimentSettings()
+    if args.resume and experiment_settings.checkpoint is None:
+        print("Resuming requires the checkpoint to be configured.")
+        sys.exit(1)
 
     command_queue: Queue[Optional[MetricCommand]] = Queue()
     metrics_store = MetricsStore(str(experiment_settings.metrics_store))
@@ -130,24 +151,35 @@ def main() -> None:
     cmd_processor_thread = threading.Thread(target=command_processor.run, daemon=True)
     cmd_processor_thread.start()
 
+    print("Scanning the reference sequences")
+    reference_catalog = ReferenceCatalog(
+        experiment_settings.reference_sequences,
+        experiment_settings.reference_panel
+    )
+
     print("Initializing aligner for the reference sequences")
-    reference_files: list[str] = [str(rf.path) for rf in experiment_settings.reference_sequences]
-    aligners: dict[str, mp.Aligner] = {
-        rf:mp.Aligner(rf) for rf in reference_files
-    }
-    classifier_factory = ClassifierFactory(aligners, reference_files)
+    aligners: list[mp.Aligner] = [
+        mp.Aligner(str(rf.minimap2_index or rf.path)) for rf in reference_catalog.files
+    ]
+    classifier_factory = ClassifierFactory(aligners, reference_catalog)
     classifier: Classifier = classifier_factory.create(experiment_settings.read_until.classifier)
 
     strata_balancer = StrataBalancer(
-        experiment_settings.reference_sequences,
+        reference_catalog,
         aligners,
         experiment_settings.minimum_mapped_bases,
         experiment_settings.minimum_reads_for_parameter_estimation,
         experiment_settings.minimum_fragments_for_ratio_estimation,
         experiment_settings.thinning_accelerator,
-        command_queue
+        experiment_settings.stratum_assignment,
+        command_queue,
+        classifier if experiment_settings.stratum_assignment.classifier_first else None
     )
 
+    if experiment_settings.warm_start is not None and not args.resume:
+        print("Seeding the estimators from an earlier run")
+        strata_balancer.warm_start(experiment_settings.warm_start)
+
     protocol_service: Union[FakeProtocolService, ProtocolService]
     sample_rate: float
     if args.simulated_dir is not None:
@@ -163,7 +195,21 @@ def main() -> None:
         protocol_service = connection.protocol
         sample_rate = float(connection.device.get_sample_rate().sample_rate)
 
-    fragment_collection = FragmentCollection()
+    fragment_collection = FragmentCollection(experiment_settings.ejected_read_retention)
+    checkpointer: Optional[Checkpointer] = None
+    ingested_files: list[str] = []
+    processed_records: dict[str, int] = dict()
+    if experiment_settings.checkpoint is not None:
+        checkpointer = Checkpointer(
+            experiment_settings.checkpoint,
+            reference_catalog,
+            strata_balancer,
+            fragment_collection
+        )
+        if args.resume:
+            print("Restoring the last checkpoint")
+            ingested_files, processed_records = checkpointer.restore()
+
     read_until_settings = experiment_settings.read_until
     read_until_regulator = ReadUntilRegulator(
         read_until_settings,
@@ -171,6 +217,7 @@ def main() -> None:
         classifier,
         strata_balancer,
         fragment_collection,
+        reference_catalog,
         command_queue
     )
     read_until_regulator.run()
@@ -180,8 +227,11 @@ def main() -> None:
         classifier,
         strata_balancer,
         fragment_collection,
-        read_processor_settings
+        read_processor_settings,
+        checkpointer
     )
+    if args.resume:
+        read_processor.resume(ingested_files, processed_records)
     observer = Observer()
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
@@ -192,7 +242,8 @@ def main() -> None:
                 start_basecalled_monitoring,
                 protocol_service,
                 observer,
-                read_processor
+                read_processor,
+                args.resume
             )
         }
 
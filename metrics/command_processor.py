@@ -30,6 +30,26 @@ class RecordClassifiedReadCommand(MetricCommand):
     def execute(self, store: MetricsStore) -> None:
         store.record_classified_reads(self._read_id, self._inferred_class, self._timestamp)
 
+class RecordBasecallBatchCommand(MetricCommand):
+    def __init__(self, reads: int, samples: int, duration: float, endpoint: str):
+        self._reads: int = reads
+        self._samples: int = samples
+        self._duration: float = duration
+        self._endpoint: str = endpoint
+        self._timestamp: str = datetime.now(timezone.utc).isoformat()
+
+    def execute(self, store: MetricsStore) -> None:
+        store.record_basecall_batch(self._reads, self._samples, self._duration, self._endpoint, self._timestamp)
+
+class RecordEventCommand(MetricCommand):
+    def __init__(self, event: str, count: int = 1):
+        self._event: str = event
+        self._count: int = count
+        self._timestamp: str = datetime.now(timezone.utc).isoformat()
+
+    def execute(self, store: MetricsStore) -> None:
+        store.record_event(self._event, self._count, self._timestamp)
+
 class PrintMessageCommand(MetricCommand):
     def __init__(self, message: str):
         self._message: str = message
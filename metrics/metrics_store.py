@@ -1,11 +1,23 @@
+import os
 from typing import Optional
 
 import sqlite3
 
 
 class MetricsStore:
-    def __init__(self, db_path: str):
-        self._conn: sqlite3.Connection = sqlite3.connect(db_path, check_same_thread=False)
+    def __init__(self, db_path: str, read_only: bool = False):
+        if read_only:
+            # an earlier run's store is only read, a wrong path must not create an empty one
+            if not os.path.isfile(db_path):
+                raise FileNotFoundError(f"{db_path} does not exist.")
+            self._conn: sqlite3.Connection = sqlite3.connect(
+                f"file:{db_path}?mode=ro",
+                uri=True,
+                check_same_thread=False
+            )
+            return
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
         self._conn.execute("PRAGMA journal_mode = WAL;")
 
         self._conn.execute("""
@@ -23,6 +35,22 @@ class MetricsStore:
           timestamp    TEXT
         )
         """)
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS basecall_batches (
+          reads        INTEGER,
+          samples      INTEGER,
+          duration     REAL,
+          endpoint     TEXT,
+          timestamp    TEXT
+        )
+        """)
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+          event        TEXT,
+          count        INTEGER,
+          timestamp    TEXT
+        )
+        """)
         self._conn.commit()
 
     def record_basecalled_reads(self, read_id: str, final_class: Optional[str], length: int, timestamp: str):
@@ -39,6 +67,30 @@ class MetricsStore:
         )
         self._conn.commit()
 
+    def record_basecall_batch(self, reads: int, samples: int, duration: float, endpoint: str, timestamp: str):
+        self._conn.execute(
+            "INSERT INTO basecall_batches (reads, samples, duration, endpoint, timestamp) VALUES (?, ?, ?, ?, ?)",
+            (reads, samples, duration, endpoint, timestamp)
+        )
+        self._conn.commit()
+
+    def record_event(self, event: str, count: int, timestamp: str):
+        self._conn.execute(
+            "INSERT INTO events (event, count, timestamp) VALUES (?, ?, ?)",
+            (event, count, timestamp)
+        )
+        self._conn.commit()
+
+    def get_basecalled_lengths(self) -> list[tuple[str, int]]:
+        return self._conn.execute(
+            "SELECT final_class, length FROM basecalled_reads WHERE final_class IS NOT NULL"
+        ).fetchall()
+
+    def get_classified_counts(self) -> list[tuple[str, int]]:
+        return self._conn.execute(
+            "SELECT inferred_class, COUNT(*) FROM classified_reads WHERE inferred_class IS NOT NULL GROUP BY inferred_class"
+        ).fetchall()
+
     def close(self):
         self._conn.commit()
         self._conn.close()
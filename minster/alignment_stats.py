@@ -1,5 +1,3 @@
-import pyfastx
-
 from minster.nanopore_read import NanoporeRead
 
 
@@ -10,12 +8,15 @@ class AlignmentStats:
     derived using the mentioned two.
     """
 
-    def __init__(self, sequence_path: str):
-        self._sequence_path: str = sequence_path
-        self._sequences: pyfastx.Fasta = pyfastx.Fasta(sequence_path)
+    def __init__(self, reference_length: int):
+        self._reference_length: int = reference_length
         self._aligned_length: int = 0
         self._read_count: int = 0
 
+    def restore(self, aligned_length: int, read_count: int) -> None:
+        self._aligned_length = aligned_length
+        self._read_count = read_count
+
     def update_aligned_length(self, read: NanoporeRead) -> None:
         self._aligned_length += len(read.get_sequence())
         self._read_count += 1
@@ -27,8 +28,8 @@ class AlignmentStats:
         return self._read_count
 
     def get_mean_coverage(self) -> float:
-        assert len(self._sequences) > 0
-        return round(self._aligned_length / len(self._sequences), 2)
+        assert self._reference_length > 0
+        return round(self._aligned_length / self._reference_length, 2)
 
     def get_mean_read_length(self) -> float:
         assert self._read_count > 0
@@ -0,0 +1,195 @@
+import time
+from queue import Queue
+from typing import Optional
+
+from pybasecall_client_lib.pyclient import PyBasecallClient
+
+from metrics.command_processor import MetricCommand, RecordBasecallBatchCommand
+from minster.config import BasecallerSettings
+
+
+class BasecallEndpoint:
+    """
+    A single connection to a basecall server together with the work it has outstanding.
+    An endpoint that cannot be reached is connected lazily on its next submission.
+    """
+    def __init__(self, address: str, config: str, client_type: type[PyBasecallClient] = PyBasecallClient):
+        self._address: str = address
+        self._config: str = config
+        self._client_type: type[PyBasecallClient] = client_type
+        self._client: Optional[PyBasecallClient] = None
+        try:
+            self._client = self._connect()
+        except Exception as e:
+            print(f"Could not connect to {address}: {e!r}")
+        self._outstanding_reads: int = 0
+        self._outstanding_samples: int = 0
+        self._pass_started: Optional[float] = None
+        self._pass_reads: int = 0
+        self._pass_samples: int = 0
+
+    def _connect(self) -> PyBasecallClient:
+        client = self._client_type(
+            address=self._address,
+            config=self._config,
+        )
+        client.set_params({'priority': self._client_type.high_priority})
+        client.connect()
+        return client
+
+    @property
+    def address(self) -> str:
+        return self._address
+
+    @property
+    def outstanding_reads(self) -> int:
+        return self._outstanding_reads
+
+    @property
+    def outstanding_samples(self) -> int:
+        return self._outstanding_samples
+
+    def reconnect(self) -> int:
+        """
+        Drops the connection together with the reads in flight on it and returns their number.
+        The pass they belonged to is dropped as well, its latency is never recorded.
+        """
+        lost_reads = self._outstanding_reads
+        self._outstanding_reads = 0
+        self._outstanding_samples = 0
+        self._pass_started = None
+        self._pass_reads = 0
+        self._pass_samples = 0
+
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.disconnect()
+            except Exception as e:
+                print(repr(e))
+        self._client = self._connect()
+        return lost_reads
+
+    def pass_reads(self, submission: list[dict], samples: int) -> bool:
+        if self._client is None:
+            try:
+                self._client = self._connect()
+            except Exception as e:
+                print(f"Could not connect to {self._address}: {e!r}")
+                return False
+        if not self._client.pass_reads(submission):
+            return False
+
+        if self._pass_started is None:
+            self._pass_started = time.monotonic()
+        self._outstanding_reads += len(submission)
+        self._outstanding_samples += samples
+        self._pass_reads += len(submission)
+        self._pass_samples += samples
+        return True
+
+    def get_completed_reads(self) -> list[dict]:
+        completed: list[dict] = []
+        if self._client is None:
+            return completed
+        for results_batch in self._client.get_completed_reads():
+            for result in results_batch:
+                if result["sub_tag"] > 0:
+                    continue
+                completed.append(result)
+
+        self._outstanding_reads -= len(completed)
+        if self._outstanding_reads <= 0:
+            self._outstanding_reads = 0
+            self._outstanding_samples = 0
+        return completed
+
+    def finish_pass(self) -> Optional[RecordBasecallBatchCommand]:
+        """
+        Returns the latency record of the work passed since the previous call, if any.
+        """
+        if self._pass_started is None:
+            return None
+
+        command = RecordBasecallBatchCommand(
+            self._pass_reads,
+            self._pass_samples,
+            time.monotonic() - self._pass_started,
+            self._address
+        )
+        self._pass_started = None
+        self._pass_reads = 0
+        self._pass_samples = 0
+        return command
+
+
+class BasecallClientPool:
+    """
+    Spreads basecalling work across connections to one or more basecall servers.
+    Every submission goes to the endpoint with the least outstanding signal and
+    endpoints that fail to accept reads are reconnected transparently. The reads in
+    flight on a reconnected endpoint are lost, their number is kept until taken.
+    """
+    def __init__(
+            self,
+            basecaller_settings: BasecallerSettings,
+            throttle: float,
+            command_queue: Queue[Optional[MetricCommand]],
+            client_type: type[PyBasecallClient] = PyBasecallClient
+    ):
+        self._throttle: float = throttle
+        self._max_attempts: int = basecaller_settings.max_attempts
+        self._command_queue: Queue[Optional[MetricCommand]] = command_queue
+        self._endpoints: list[BasecallEndpoint] = [
+            BasecallEndpoint(str(address), basecaller_settings.config, client_type)
+            for address in [basecaller_settings.address, *basecaller_settings.additional_addresses]
+            for _ in range(basecaller_settings.connections_per_address)
+        ]
+        self._lost_reads: int = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._endpoints)
+
+    def get_outstanding_reads(self) -> int:
+        return sum(endpoint.outstanding_reads for endpoint in self._endpoints)
+
+    def take_lost_reads(self) -> int:
+        lost_reads, self._lost_reads = self._lost_reads, 0
+        return lost_reads
+
+    def _reconnect(self, endpoint: BasecallEndpoint) -> None:
+        try:
+            self._lost_reads += endpoint.reconnect()
+        except Exception as e:
+            print(f"Could not reconnect to {endpoint.address}: {e!r}")
+
+    def submit(self, submission: list[dict], samples: int) -> bool:
+        for endpoint in sorted(self._endpoints, key=lambda e: e.outstanding_samples):
+            for _ in range(self._max_attempts):
+                if endpoint.pass_reads(submission, samples):
+                    return True
+                time.sleep(self._throttle)
+
+            self._reconnect(endpoint)
+        return False
+
+    def abandon_outstanding(self) -> None:
+        """
+        Reconnects every endpoint that still has reads in flight, their results are not waited for.
+        """
+        for endpoint in self._endpoints:
+            if endpoint.outstanding_reads > 0:
+                self._reconnect(endpoint)
+
+    def get_completed_reads(self) -> list[dict]:
+        completed: list[dict] = []
+        for endpoint in self._endpoints:
+            if endpoint.outstanding_reads == 0:
+                continue
+            completed.extend(endpoint.get_completed_reads())
+            if endpoint.outstanding_reads == 0:
+                command = endpoint.finish_pass()
+                if command is not None:
+                    self._command_queue.put(command)
+        return completed
@@ -0,0 +1,83 @@
+import os
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from minster.config import CheckpointSettings
+from minster.fragment_collection import FragmentCollection
+from minster.reference_catalog import ReferenceCatalog
+from minster.strata_balancer import StrataBalancer
+
+
+class Checkpointer:
+    """
+    Writes snapshots of the balancer, estimator, alignment and ejected read state to a
+    single numpy archive and restores them, so that a restarted run does not have to
+    warm up again. The archive is written next to its final path and renamed over it,
+    a crash never leaves a partial snapshot behind.
+    """
+    def __init__(
+            self,
+            checkpoint_settings: CheckpointSettings,
+            reference_catalog: ReferenceCatalog,
+            strata_balancer: StrataBalancer,
+            fragment_collection: FragmentCollection
+    ):
+        self._path: Path = checkpoint_settings.path
+        self._interval: float = checkpoint_settings.interval
+        self._reference_catalog: ReferenceCatalog = reference_catalog
+        self._strata_balancer: StrataBalancer = strata_balancer
+        self._fragment_collection: FragmentCollection = fragment_collection
+        self._last_saved: float = time.monotonic()
+
+    def _reference_hashes(self) -> np.ndarray:
+        return np.array([reference_file.content_hash for reference_file in self._reference_catalog.files])
+
+    def _strata_names(self) -> np.ndarray:
+        return np.array([entry.name for entry in self._reference_catalog])
+
+    def is_due(self) -> bool:
+        return time.monotonic() - self._last_saved >= self._interval
+
+    def save(self, ingested_files: Iterable[str], processed_records: dict[str, int]) -> None:
+        state = {
+            **self._strata_balancer.export_state(),
+            **self._fragment_collection.export_state(),
+            "reference_hashes": self._reference_hashes(),
+            "strata_names": self._strata_names(),
+            "ingested_files": np.array(list(ingested_files), dtype=np.str_),
+            "partial_files": np.array(list(processed_records.keys()), dtype=np.str_),
+            "partial_records": np.array(list(processed_records.values()), dtype=np.int64)
+        }
+
+        partial_path = self._path.with_name(self._path.name + ".partial")
+        with open(partial_path, "wb") as checkpoint_file:
+            np.savez(checkpoint_file, **state)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(partial_path, self._path)
+        self._last_saved = time.monotonic()
+
+    def restore(self) -> tuple[list[str], dict[str, int]]:
+        """
+        Restores the state of the last snapshot and returns the FASTQ files whose reads it
+        already includes, and for the files it includes in part, the number of their
+        leading records whose reads it includes.
+        """
+        with np.load(self._path, allow_pickle=False) as archive:
+            state = {key: archive[key] for key in archive.files}
+
+        if not np.array_equal(state["reference_hashes"], self._reference_hashes()):
+            raise ValueError(f"{self._path} was written for different reference sequences.")
+        if not np.array_equal(state["strata_names"], self._strata_names()):
+            raise ValueError(f"{self._path} was written for different strata.")
+
+        self._strata_balancer.restore_state(state)
+        self._fragment_collection.restore_state(state)
+        self._last_saved = time.monotonic()
+        return (
+            state["ingested_files"].tolist(),
+            dict(zip(state["partial_files"].tolist(), state["partial_records"].tolist()))
+        )
@@ -0,0 +1,145 @@
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+from minknow_api.data_pb2 import GetLiveReadsResponse
+
+from minster.dorado_wrapper import ReadChunk
+
+
+class ScheduledChunks(NamedTuple):
+    to_basecall: list[tuple[int, GetLiveReadsResponse.ReadData]]
+    expired: list[ReadChunk]
+    shed: list[ReadChunk]
+
+
+class ChunkScheduler:
+    """
+    Orders the read chunks waiting for the basecaller by their remaining decision budget
+    (earliest deadline first). The budget of a read is the time left until it grows past
+    the length at which unblocking it is still worthwhile. Reads that exhausted their budget
+    are returned as expired instead of being basecalled. Reads on low priority channels
+    only fill the batch after all the others, so they are the first to be shed. When
+    shedding load, reads that do not fit into the batch are returned as shed instead of
+    waiting for the next pass.
+    """
+    def __init__(
+            self,
+            sampling_rate: float,
+            decision_deadline: Optional[float],
+            low_priority_channels: Iterable[int] = ()
+    ):
+        self._deadline_samples: Optional[int] = (
+            None if decision_deadline is None else int(decision_deadline * sampling_rate)
+        )
+        self._low_priority_channels: frozenset[int] = frozenset(low_priority_channels)
+        # chunks not yet basecalled, by channel
+        self._pending: dict[int, GetLiveReadsResponse.ReadData] = dict()
+        # chunks that did not fit into the last batch, counted before any were shed
+        self._backlog: int = 0
+
+    @staticmethod
+    def _read_samples(read: GetLiveReadsResponse.ReadData, itemsize: int) -> int:
+        # the accumulating cache only extends raw_data of the first chunk of a read
+        return read.chunk_start_sample - read.start_sample + len(read.raw_data) // itemsize
+
+    def schedule(
+            self,
+            reads: list[tuple[int, GetLiveReadsResponse.ReadData]],
+            signal_dtype: np.dtype[str],
+            batch_size: int,
+            shed_excess: bool = False
+    ) -> ScheduledChunks:
+        for channel, read in reads:
+            self._pending[channel] = read
+
+        itemsize = np.dtype(signal_dtype).itemsize
+        by_age: list[tuple[int, int, GetLiveReadsResponse.ReadData]] = sorted(
+            (
+                (self._read_samples(read, itemsize), channel, read)
+                for channel, read in self._pending.items()
+            ),
+            key=lambda item: (item[1] not in self._low_priority_channels, item[0]),
+            reverse=True
+        )
+
+        expired: list[ReadChunk] = []
+        shed: list[ReadChunk] = []
+        to_basecall: list[tuple[int, GetLiveReadsResponse.ReadData]] = []
+        for read_samples, channel, read in by_age:
+            if self._deadline_samples is not None and read_samples >= self._deadline_samples:
+                expired.append(ReadChunk(channel, read.id))
+                del self._pending[channel]
+            elif len(to_basecall) < batch_size:
+                to_basecall.append((channel, read))
+                del self._pending[channel]
+            elif shed_excess:
+                shed.append(ReadChunk(channel, read.id))
+                del self._pending[channel]
+
+        self._backlog = len(by_age) - len(to_basecall) - len(expired)
+        return ScheduledChunks(to_basecall, expired, shed)
+
+    def get_backlog(self) -> int:
+        """
+        The chunks that did not fit into the last batch, the shed ones included.
+        """
+        return self._backlog
+
+
+class LoadShedder:
+    """
+    Tracks the basecaller round-trip time (as an exponentially weighted moving average)
+    and the backlog of chunks waiting for it. While either exceeds its budget the batch
+    size is halved on every pass and the chunks that do not fit are shed, unless the
+    shed action is to skip them; once the basecaller catches up the batch size grows
+    back by one per pass.
+    """
+    def __init__(
+            self,
+            max_batch_size: int,
+            latency_budget: Optional[float],
+            max_backlog: Optional[int],
+            smoothing: float = 0.2
+    ):
+        self._max_batch_size: int = max_batch_size
+        self._latency_budget: Optional[float] = latency_budget
+        self._max_backlog: Optional[int] = max_backlog
+        self._smoothing: float = smoothing
+        self._round_trip: Optional[float] = None
+        self._batch_size: int = max_batch_size
+        self._overloaded: bool = False
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @property
+    def overloaded(self) -> bool:
+        return self._overloaded
+
+    @property
+    def round_trip(self) -> Optional[float]:
+        return self._round_trip
+
+    def observe(self, round_trip: Optional[float], backlog: int) -> bool:
+        """
+        Returns True if the batch size was shrunk.
+        """
+        if round_trip is not None:
+            self._round_trip = (
+                round_trip if self._round_trip is None
+                else self._smoothing * round_trip + (1 - self._smoothing) * self._round_trip
+            )
+
+        self._overloaded = (
+            (self._latency_budget is not None and self._round_trip is not None and self._round_trip > self._latency_budget) or
+            (self._max_backlog is not None and backlog > self._max_backlog)
+        )
+        if self._overloaded:
+            shrunk_batch_size = max(1, self._batch_size // 2)
+            shrunk = shrunk_batch_size < self._batch_size
+            self._batch_size = shrunk_batch_size
+            return shrunk
+
+        self._batch_size = min(self._max_batch_size, self._batch_size + 1)
+        return False
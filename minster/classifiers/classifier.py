@@ -1,16 +1,107 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 from typing import Optional
 
+import numpy as np
+
+
+@dataclass
+class ClassificationSession:
+    """
+    Per-read classification state kept between the passes over an accumulating read.
+    Only the bases basecalled since the previous pass (plus a small overlap) are scored
+    and their evidence is added to the evidence collected so far, a read stays undecided
+    until the evidence for one container is strong enough.
+    """
+    _read_id: str
+    _scored_length: int = 0
+    _evidence: dict[int, tuple[int, int, int]] = field(default_factory=dict)
+    _windowed: bool = False
+
+    @property
+    def read_id(self) -> str:
+        return self._read_id
+
+    @property
+    def scored_length(self) -> int:
+        return self._scored_length
+
+    def mark_windowed(self) -> None:
+        """
+        The next sequence was basecalled from a signal window that only covers the
+        new signal (and its own overlap), so it is scored as a whole.
+        """
+        self._windowed = True
+
+    def take_increment(self, sequence: str, overlap: int, undecided_length: int = 0) -> str:
+        """
+        The part of the sequence to score. Until there is any evidence, the new bases are
+        scored together with up to as many (at most `undecided_length`) bases before them,
+        so that hits crossing the boundary of the previous pass are not lost, while the
+        bases scored per pass stay proportional to the new ones.
+        """
+        if self._windowed:
+            self._windowed = False
+            self._scored_length += len(sequence)
+            return sequence
+
+        start = max(0, self._scored_length - overlap)
+        if len(self._evidence) == 0:
+            new_bases = len(sequence) - self._scored_length
+            start = min(start, max(0, self._scored_length - min(undecided_length, new_bases)))
+        self._scored_length = len(sequence)
+        return sequence[start:]
+
+    def add_evidence(self, container_id: int, quality: int, length: int, penalty: int) -> None:
+        best_quality, total_length, total_penalty = self._evidence.get(container_id, (0, 0, 0))
+        self._evidence[container_id] = (
+            max(best_quality, quality),
+            total_length + length,
+            total_penalty + penalty
+        )
+
+    def get_evidence_length(self, container_id: int) -> int:
+        return self._evidence.get(container_id, (0, 0, 0))[1]
+
+    def best_container(self) -> Optional[int]:
+        if len(self._evidence) == 0:
+            return None
+        return max(self._evidence.items(), key=lambda item: (item[1][0], item[1][1], -item[1][2]))[0]
+
+    def decided_container(self, min_length: int) -> Optional[int]:
+        """
+        The best container once its evidence adds up to at least `min_length`, None while
+        the read is undecided.
+        """
+        container_id = self.best_container()
+        if container_id is None or self.get_evidence_length(container_id) < min_length:
+            return None
+        return container_id
+
 
 class Classifier(ABC):
     @abstractmethod
-    def activate_sequences(self, container_id: str) -> None:
+    def activate_sequences(self, container_id: int) -> None:
+        pass
+
+    @abstractmethod
+    def deactivate_sequences(self, container_id: int) -> None:
         pass
 
     @abstractmethod
-    def deactivate_sequences(self, container_id: str) -> None:
+    def is_sequence_present(self, sequence: str) -> Optional[int]:
         pass
 
     @abstractmethod
-    def is_sequence_present(self, sequence: str) -> Optional[str]:
+    def classify_increment(self, session: ClassificationSession, sequence: str) -> Optional[int]:
+        pass
+
+
+class SignalClassifier(ABC):
+    """
+    A classifier that also assigns raw signal to a stratum, the read until chunks are
+    classified with it without being basecalled.
+    """
+    @abstractmethod
+    def is_signal_present(self, signal: np.ndarray) -> Optional[int]:
         pass
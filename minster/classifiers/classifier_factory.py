@@ -3,23 +3,68 @@ import mappy as mp
 from minster.classifiers.classifier import Classifier
 from minster.classifiers.ibf_wrapper import IBFWrapper
 from minster.classifiers.mappy_wrapper import MappyWrapper
-from minster.config import ClassifierSettings
+from minster.classifiers.minimizer_sketch import MinimizerSketch
+from minster.classifiers.raw_signal_classifier import RawSignalClassifier
+from minster.config import AlignerProfileSettings, ClassifierSettings
+from minster.reference_catalog import ReferenceCatalog
 
 
 class ClassifierFactory:
-    def __init__(self, aligners: dict[str, mp.Aligner], reference_files: list[str],
+    def __init__(self, aligners: list[mp.Aligner], reference_catalog: ReferenceCatalog,
     ) -> None:
-        self._aligners: dict[str, mp.Aligner] = aligners
-        self._reference_files: list[str] = reference_files
+        self._aligners: list[mp.Aligner] = aligners
+        self._reference_catalog: ReferenceCatalog = reference_catalog
+
+    def _build_classification_aligners(self, profile: AlignerProfileSettings) -> list[mp.Aligner]:
+        """
+        Aligners tuned for assigning short chunks to a stratum: narrow extension bands,
+        relaxed chaining for a few hundred bases and no secondary hits. A prebuilt minimap2
+        index is loaded instead of indexing the reference again, k and w then come from it.
+        mappy cannot share an index between aligners, so these hold a second copy of the
+        index of every reference next to the aligners of the strata balancer.
+        """
+        return [
+            mp.Aligner(
+                str(reference_file.minimap2_index or reference_file.path),
+                preset=profile.preset,
+                k=profile.k,
+                w=profile.w,
+                min_cnt=profile.min_cnt,
+                min_chain_score=profile.min_chain_score,
+                max_chain_skip=profile.max_chain_skip,
+                bw=profile.bw,
+                bw_long=profile.bw,
+                best_n=profile.best_n
+            )
+            for reference_file in self._reference_catalog.files
+        ]
 
     def create(self, cfg: ClassifierSettings) -> Classifier:
         if cfg.mappy is not None:
-            return MappyWrapper(self._aligners)
+            sketch = None
+            if cfg.mappy.prefilter is not None:
+                sketch = MinimizerSketch(cfg.mappy.prefilter, self._reference_catalog)
+            aligners = self._aligners
+            if cfg.mappy.classification_profile is not None:
+                aligners = self._build_classification_aligners(cfg.mappy.classification_profile)
+            return MappyWrapper(
+                aligners,
+                self._reference_catalog,
+                cfg.mappy.undecided_tail_length,
+                cfg.mappy.decision_mapped_length,
+                sketch
+            )
 
         if cfg.interleaved_bloom_filter is not None:
             return IBFWrapper(
                 cfg.interleaved_bloom_filter,
-                self._reference_files,
+                self._reference_catalog,
+            )
+
+        if cfg.raw_signal is not None:
+            return RawSignalClassifier(
+                cfg.raw_signal,
+                self._reference_catalog,
             )
 
         raise ValueError("No valid classifier configuration passed")
@@ -1,25 +1,25 @@
 import threading
 from typing import Optional
 
-import pyfastx
 from interleaved_bloom_filter import InterleavedBloomFilter
 from math import exp, log, ceil
 
-from minster.classifiers.classifier import Classifier
+from minster.classifiers.classifier import Classifier, ClassificationSession
 from minster.config import IBFSettings
+from minster.reference_catalog import ReferenceCatalog
 
 
 class IBFWrapper(Classifier):
     """
     A classifier that uses interleaved bloom filters implemented in Rust.
+    Every bin stays active in the filter, the activation state is a bitmask over the bins
+    that is applied to the hits, so toggling a bin never rebuilds the filter or blocks lookups.
     """
-    def __init__(self, ibf_settings: IBFSettings, reference_files: list[str]):
-        reference_containers = [(rf, pyfastx.Fasta(rf)) for rf in reference_files]
-
+    def __init__(self, ibf_settings: IBFSettings, reference_catalog: ReferenceCatalog):
         self._ibf: InterleavedBloomFilter = InterleavedBloomFilter(
             ibf_settings.num_of_bins,
             IBFWrapper.calculate_sbf_size(
-                max(len(container) for _, container in reference_containers),
+                max(entry.length for entry in reference_catalog),
                 ibf_settings.w,
                 ibf_settings.k,
                 ibf_settings.hashes,
@@ -30,13 +30,16 @@ class IBFWrapper(Classifier):
             ibf_settings.k,
             ibf_settings.hashes
         )
+        # serializes the writers only, the mask is swapped in a single assignment
         self._lock: threading.Lock = threading.Lock()
-        self._enabled_bins: dict[str, bool] = dict()
+        # bins are named after the strata, the bit of a stratum in the mask is its id
+        self._strata_ids: dict[str, int] = {entry.name: entry.strata_id for entry in reference_catalog}
+        self._active_mask: int = 0
 
-        for container_path, container in reference_containers:
-            for sequence in container:
-                self._ibf.insert_sequence(container_path, sequence.seq)
-                self._enabled_bins[container_path] = False
+        for strata_id, sequence in reference_catalog.iter_contigs():
+            self._ibf.insert_sequence(reference_catalog.get_name(strata_id), sequence)
+        for entry in reference_catalog:
+            self._ibf.activate_filter(entry.name)
 
     @staticmethod
     def calculate_sbf_size(max_genome_len: int, w: int, k: int, num_hashes: int, fp_rate: float):
@@ -47,20 +50,27 @@ class IBFWrapper(Classifier):
             )
         )
 
-    def activate_sequences(self, container_id: str) -> None:
+    def activate_sequences(self, container_id: int) -> None:
         with self._lock:
-            self._ibf.activate_filter(container_id)
-            self._enabled_bins[container_id] = True
+            self._active_mask = self._active_mask | (1 << container_id)
 
-    def deactivate_sequences(self, container_id: str) -> None:
+    def deactivate_sequences(self, container_id: int) -> None:
         with self._lock:
-            self._enabled_bins[container_id] = False
+            self._active_mask = self._active_mask & ~(1 << container_id)
 
-            self._ibf.reset_filter()
-            for (bin_id, active) in self._enabled_bins.items():
-                if active:
-                    self._ibf.activate_filter(bin_id)
+    def _active_hit(self, sequence: str) -> Optional[int]:
+        bin_name = self._ibf.is_sequence_present(sequence)
+        if bin_name is None:
+            return None
+        container_id = self._strata_ids[bin_name]
+        if not (self._active_mask >> container_id) & 1:
+            return None
+        return container_id
 
-    def is_sequence_present(self, sequence: str) -> Optional[str]:
-        with self._lock:
-            return self._ibf.is_sequence_present(sequence)
+    def is_sequence_present(self, sequence: str) -> Optional[int]:
+        return self._active_hit(sequence)
+
+    def classify_increment(self, session: ClassificationSession, sequence: str) -> Optional[int]:
+        # a bin is called on the share of windows it holds, which is only reliable on the
+        # whole read, so every pass scores the entire accumulated sequence
+        return self._active_hit(sequence)
@@ -1,67 +1,107 @@
 import threading
-from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, Optional
 
 import mappy as mp
 
-from minster.classifiers.classifier import Classifier
+from minster.classifiers.classifier import Classifier, ClassificationSession
+from minster.classifiers.minimizer_sketch import MinimizerSketch
+from minster.reference_catalog import ReferenceCatalog
 
 
-@dataclass
-class AlignerRecord:
-    _aligner: mp.Aligner
-    _active: bool = False
-
-    @property
-    def aligner(self) -> mp.Aligner:
-        return self._aligner
-
-    @property
-    def active(self) -> bool:
-        return self._active
-
-    def toggle_active(self) -> None:
-        self._active = not self.active
-
 class MappyWrapper(Classifier):
     """
     A classifier that uses Mappy, a python interface to Minimap2.
+    There is an aligner for every reference file, its hits are resolved to strata by their
+    contig. With a minimizer sketch only the strata the sketch supports are mapped against.
     """
-    def __init__(self, aligners: dict[str, mp.Aligner]):
+    def __init__(
+            self,
+            aligners: list[mp.Aligner],
+            reference_catalog: ReferenceCatalog,
+            undecided_tail_length: int,
+            decision_mapped_length: int,
+            sketch: Optional[MinimizerSketch] = None
+    ):
         self._thr_buf: mp.ThreadBuffer = mp.ThreadBuffer()
-        self._all_aligners: dict[str, AlignerRecord] = {key:AlignerRecord(aligner) for (key, aligner) in aligners.items()}
+        self._aligners: list[mp.Aligner] = aligners
+        self._reference_catalog: ReferenceCatalog = reference_catalog
+        # the strata of every aligner, an aligner is skipped if none of them is active
+        self._file_strata: list[list[int]] = [
+            reference_catalog.get_file_strata(file_number) for file_number in range(len(aligners))
+        ]
+        self._active: list[bool] = [False] * len(reference_catalog)
         self._lock: threading.Lock = threading.Lock()
+        # minimizers spanning the boundary of the previous pass are re-scored
+        self._overlap: int = max((aligner.k + aligner.w for aligner in aligners), default=0)
+        self._undecided_tail_length: int = undecided_tail_length
+        self._decision_mapped_length: int = decision_mapped_length
+        self._sketch: Optional[MinimizerSketch] = sketch
+
+    def _candidates(self, sequence: str) -> Optional[set[int]]:
+        if self._sketch is None:
+            return None
+        return self._sketch.candidates(sequence)
 
-    def activate_sequences(self, container_id: str) -> None:
+    def activate_sequences(self, container_id: int) -> None:
         with self._lock:
-            if not self._all_aligners[container_id].active:
-                self._all_aligners[container_id].toggle_active()
+            self._active[container_id] = True
 
-    def deactivate_sequences(self, container_id: str) -> None:
+    def deactivate_sequences(self, container_id: int) -> None:
         with self._lock:
-            if self._all_aligners[container_id].active:
-                self._all_aligners[container_id].toggle_active()
+            self._active[container_id] = False
 
-    def is_sequence_present(self, sequence: str) -> Optional[str]:
-        best_algn_key: Optional[tuple[int, int, int]] = None
-        best_cont_id: Optional[str] = None
+    def _primary_hits(self, sequence: str, candidates: Optional[set[int]]) -> Iterable[tuple[int, mp.Alignment]]:
+        """
+        The primary hits of the sequence in the active (and candidate) strata. Must be called with the lock held.
+        """
+        for file_number, aligner in enumerate(self._aligners):
+            if not any(
+                self._active[strata_id] and (candidates is None or strata_id in candidates)
+                for strata_id in self._file_strata[file_number]
+            ):
+                continue
 
-        with self._lock:
-            for container_id, aligner_record in self._all_aligners.items():
-                if not aligner_record.active:
+            for hit in aligner.map(sequence, buf=self._thr_buf):
+                if not hit.is_primary:
+                    continue
+                container_id = self._reference_catalog.resolve_contig(file_number, hit.ctg)
+                if container_id is None or not self._active[container_id]:
+                    continue
+                if candidates is not None and container_id not in candidates:
                     continue
+                yield container_id, hit
 
-                for hit in aligner_record.aligner.map(sequence, buf=self._thr_buf):
-                    if not hit.is_primary:
-                        continue
+    def is_sequence_present(self, sequence: str) -> Optional[int]:
+        best_algn_key: Optional[tuple[int, int, int]] = None
+        best_cont_id: Optional[int] = None
+
+        candidates = self._candidates(sequence)
+        if candidates is not None and len(candidates) == 0:
+            return None
 
-                    algn_key = (
-                        hit.mapq,
-                        hit.mlen,
-                        -hit.NM
-                    )
-                    if best_algn_key is None or algn_key > best_algn_key:
-                        best_cont_id = container_id
-                        best_algn_key = algn_key
+        with self._lock:
+            for container_id, hit in self._primary_hits(sequence, candidates):
+                algn_key = (
+                    hit.mapq,
+                    hit.mlen,
+                    -hit.NM
+                )
+                if best_algn_key is None or algn_key > best_algn_key:
+                    best_cont_id = container_id
+                    best_algn_key = algn_key
 
         return best_cont_id
+
+    def classify_increment(self, session: ClassificationSession, sequence: str) -> Optional[int]:
+        increment = session.take_increment(sequence, self._overlap, self._undecided_tail_length)
+
+        candidates = self._candidates(increment)
+        if candidates is not None and len(candidates) == 0:
+            return session.decided_container(self._decision_mapped_length)
+
+        with self._lock:
+            for container_id, hit in self._primary_hits(increment, candidates):
+                session.add_evidence(container_id, hit.mapq, hit.mlen, hit.NM)
+
+        # weak hits are kept and added up with the hits of the next passes
+        return session.decided_container(self._decision_mapped_length)
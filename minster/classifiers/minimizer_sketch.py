@@ -0,0 +1,101 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from minster.classifiers.sequence_codes import (
+    ambiguous_windows,
+    encode,
+    index_strata,
+    reverse_complement,
+    rolling_code
+)
+from minster.config import MinimizerSketchSettings
+from minster.reference_catalog import ReferenceCatalog
+
+_NO_MINIMIZER: np.uint64 = np.uint64(np.iinfo(np.uint64).max)
+
+
+def _hash_kmers(kmers: np.ndarray, k: int) -> np.ndarray:
+    """
+    Invertible integer hash of 2k-bit k-mer codes (the one minimap2 uses), so that
+    minimizers are not biased towards poly-A.
+    """
+    mask = np.uint64((1 << (2 * k)) - 1)
+    key = kmers.copy()
+    key = (~key + (key << np.uint64(21))) & mask
+    key ^= key >> np.uint64(24)
+    key = (key + (key << np.uint64(3)) + (key << np.uint64(8))) & mask
+    key ^= key >> np.uint64(14)
+    key = (key + (key << np.uint64(2)) + (key << np.uint64(4))) & mask
+    key ^= key >> np.uint64(28)
+    key = (key + (key << np.uint64(31))) & mask
+    return key
+
+
+class MinimizerSketch:
+    """
+    A compact table of the canonical (w, k)-minimizers of the references and the strata
+    they occur in. A chunk is scored against all strata in one pass by looking up its
+    own minimizers, which is enough to rule out chunks that cannot map anywhere.
+    """
+    def __init__(self, sketch_settings: MinimizerSketchSettings, reference_catalog: ReferenceCatalog):
+        self._k: int = sketch_settings.k
+        self._w: int = sketch_settings.w
+        self._min_hits: int = sketch_settings.min_hits
+        self._sampling: np.uint64 = np.uint64(sketch_settings.sampling)
+        self._strata_count: int = len(reference_catalog)
+
+        per_reference = index_strata(reference_catalog, self._minimizers, self._k + self._w - 2)
+        hashes = np.concatenate([np.zeros(0, dtype=np.uint64), *per_reference])
+        strata = np.concatenate([
+            np.zeros(0, dtype=np.int32),
+            *(np.full(len(index), i, dtype=np.int32) for i, index in enumerate(per_reference))
+        ])
+        order = np.argsort(hashes, kind="stable")
+        self._hashes: np.ndarray = hashes[order]
+        self._strata: np.ndarray = strata[order]
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _minimizers(self, codes: np.ndarray) -> np.ndarray:
+        if len(codes) < self._k + self._w - 1:
+            return np.zeros(0, dtype=np.uint64)
+
+        unambiguous = np.minimum(codes, 3)
+        forward = rolling_code(unambiguous, 4, self._k)
+        backward = rolling_code(reverse_complement(unambiguous), 4, self._k)[::-1]
+        hashes = _hash_kmers(np.minimum(forward, backward), self._k)
+        hashes[ambiguous_windows(codes, self._k)] = _NO_MINIMIZER
+
+        minimizers = sliding_window_view(hashes, self._w).min(axis=1)
+        minimizers = minimizers[minimizers != _NO_MINIMIZER]
+        if self._sampling > 1:
+            minimizers = minimizers[minimizers % self._sampling == 0]
+        return np.unique(minimizers)
+
+    def count_hits(self, sequence: str) -> np.ndarray:
+        """
+        The number of distinct minimizers of the sequence found in every stratum.
+        """
+        hits = np.zeros(self._strata_count, dtype=np.int64)
+        minimizers = self._minimizers(encode(sequence))
+        if len(minimizers) == 0 or len(self._hashes) == 0:
+            return hits
+
+        lo = np.searchsorted(self._hashes, minimizers, side="left")
+        hi = np.searchsorted(self._hashes, minimizers, side="right")
+        matches = hi - lo
+        total = int(matches.sum())
+        if total == 0:
+            return hits
+
+        # expand every [lo, hi) range into the positions of the table it covers
+        positions = np.repeat(lo - (np.cumsum(matches) - matches), matches) + np.arange(total)
+        hits += np.bincount(self._strata[positions], minlength=self._strata_count)
+        return hits
+
+    def candidates(self, sequence: str) -> set[int]:
+        """
+        The strata that share at least `min_hits` minimizers with the sequence.
+        """
+        return set(np.flatnonzero(self.count_hits(sequence) >= self._min_hits).tolist())
@@ -0,0 +1,206 @@
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from minster.classifiers.classifier import Classifier, ClassificationSession, SignalClassifier
+from minster.classifiers.sequence_codes import ambiguous_windows, encode, index_strata, rolling_code
+from minster.config import RawSignalSettings
+from minster.reference_catalog import ReferenceCatalog
+
+_SEED_HASH_MULTIPLIER: np.uint64 = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _robust_normalize(levels: np.ndarray) -> np.ndarray:
+    median = np.median(levels)
+    spread = 1.4826 * np.median(np.abs(levels - median))
+    return (levels - median) / (spread if spread > 0 else 1.0)
+
+
+class PoreModel:
+    """
+    A k-mer pore model that maps every k-mer to its expected (normalized) current level.
+    The model file holds a k-mer and its mean level on every line, as in ONT's kmer_models.
+    """
+    def __init__(self, model_path: Path):
+        kmers: list[str] = []
+        levels: list[float] = []
+        with open(model_path, "rt") as model_file:
+            for line in model_file:
+                parts = line.split()
+                if len(parts) < 2:
+                    continue
+                try:
+                    level = float(parts[1])
+                except ValueError:
+                    # header
+                    continue
+                kmers.append(parts[0].upper())
+                levels.append(level)
+
+        if len(kmers) == 0:
+            raise ValueError(f"{model_path} does not contain any k-mer levels.")
+
+        self._k: int = len(kmers[0])
+        self._levels: np.ndarray = np.zeros(4 ** self._k, dtype=np.float64)
+        normalized = _robust_normalize(np.array(levels, dtype=np.float64))
+        for kmer, level in zip(kmers, normalized):
+            codes = encode(kmer)
+            if len(kmer) != self._k or np.any(codes == 4):
+                raise ValueError(f"{model_path} contains an invalid k-mer {kmer}.")
+            self._levels[int(rolling_code(codes, 4, self._k)[0])] = level
+
+    @property
+    def k(self) -> int:
+        return self._k
+
+    @property
+    def levels(self) -> np.ndarray:
+        return self._levels
+
+    def expected_levels(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Expected levels of all k-mers of a base-code array; k-mers with ambiguous bases are skipped.
+        """
+        if len(codes) < self._k:
+            return np.zeros(0, dtype=np.float64)
+
+        ambiguous = ambiguous_windows(codes, self._k)
+        kmer_ids = rolling_code(np.minimum(codes, 3), 4, self._k)
+        return self._levels[kmer_ids[~ambiguous].astype(np.int64)]
+
+
+class RawSignalClassifier(Classifier, SignalClassifier):
+    """
+    A classifier that assigns raw nanopore signal to a reference without basecalling it.
+    The signal is segmented into events, the event levels are quantized and runs of
+    quantized levels are looked up in per-reference indexes of the expected signal
+    predicted by a k-mer pore model.
+    """
+    def __init__(self, raw_signal_settings: RawSignalSettings, reference_catalog: ReferenceCatalog):
+        self._pore_model: PoreModel = PoreModel(raw_signal_settings.pore_model)
+        self._quantization_levels: int = raw_signal_settings.quantization_levels
+        self._seed_length: int = raw_signal_settings.seed_length
+        self._seed_sampling: int = raw_signal_settings.seed_sampling
+        self._min_seed_hits: int = raw_signal_settings.min_seed_hits
+        self._event_window: int = raw_signal_settings.event_window
+        self._event_threshold: float = raw_signal_settings.event_threshold
+        self._min_event_length: int = raw_signal_settings.min_event_length
+        # equal-frequency bins of the model levels
+        self._quantization_edges: np.ndarray = np.quantile(
+            self._pore_model.levels,
+            np.linspace(0, 1, self._quantization_levels + 1)[1:-1]
+        )
+
+        self._lock: threading.Lock = threading.Lock()
+        # both indexed by the stratum id
+        self._active: list[bool] = [False] * len(reference_catalog)
+        self._seed_indexes: list[np.ndarray] = index_strata(
+            reference_catalog,
+            lambda block: np.unique(self._seeds(self._pore_model.expected_levels(block))),
+            self._pore_model.k - 1,
+            both_strands=True
+        )
+
+    def _seeds(self, levels: np.ndarray) -> np.ndarray:
+        symbols = np.searchsorted(self._quantization_edges, levels)
+        if len(symbols) == 0:
+            return np.zeros(0, dtype=np.uint64)
+        # a k-mer may be split into several events (or merged), so only level changes count
+        symbols = symbols[np.concatenate(([True], symbols[1:] != symbols[:-1]))]
+        if len(symbols) < self._seed_length:
+            return np.zeros(0, dtype=np.uint64)
+
+        seeds = rolling_code(symbols, self._quantization_levels, self._seed_length)
+        if self._seed_sampling > 1:
+            hashed = (seeds * _SEED_HASH_MULTIPLIER) >> np.uint64(32)
+            seeds = seeds[hashed % np.uint64(self._seed_sampling) == 0]
+        return seeds
+
+    def _detect_events(self, signal: np.ndarray) -> np.ndarray:
+        """
+        Segments the signal where the t-statistic between two adjacent windows peaks
+        above the threshold and returns the mean level of every event.
+        """
+        window = self._event_window
+        values = signal.astype(np.float64)
+        if len(values) < 2 * window:
+            return np.zeros(0, dtype=np.float64)
+
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        squares = np.concatenate(([0.0], np.cumsum(values * values)))
+        positions = np.arange(window, len(values) - window + 1)
+        left_mean = (sums[positions] - sums[positions - window]) / window
+        right_mean = (sums[positions + window] - sums[positions]) / window
+        left_var = (squares[positions] - squares[positions - window]) / window - left_mean ** 2
+        right_var = (squares[positions + window] - squares[positions]) / window - right_mean ** 2
+        t_stat = np.abs(left_mean - right_mean) / np.sqrt(
+            np.maximum(left_var + right_var, 1e-12) / window
+        )
+
+        is_peak = np.zeros(len(t_stat), dtype=bool)
+        is_peak[1:-1] = (t_stat[1:-1] >= t_stat[:-2]) & (t_stat[1:-1] > t_stat[2:])
+        candidates = positions[is_peak & (t_stat > self._event_threshold)]
+
+        boundaries: list[int] = [0]
+        for candidate in candidates:
+            if candidate - boundaries[-1] >= self._min_event_length:
+                boundaries.append(int(candidate))
+        if len(values) - boundaries[-1] >= self._min_event_length:
+            boundaries.append(len(values))
+        else:
+            boundaries[-1] = len(values)
+
+        edges = np.array(boundaries)
+        return (sums[edges[1:]] - sums[edges[:-1]]) / np.diff(edges)
+
+    def _count_hits(self, seeds: np.ndarray) -> dict[int, int]:
+        seeds = np.unique(seeds)
+        hits: dict[int, int] = dict()
+        if len(seeds) == 0:
+            return hits
+
+        with self._lock:
+            active_ids = [container_id for container_id, active in enumerate(self._active) if active]
+        for container_id in active_ids:
+            index = self._seed_indexes[container_id]
+            if len(index) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(index, seeds), len(index) - 1)
+            hits[container_id] = int(np.count_nonzero(index[positions] == seeds))
+        return hits
+
+    def _best_container(self, hits: dict[int, int]) -> Optional[int]:
+        ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)
+        if len(ranked) == 0 or ranked[0][1] < self._min_seed_hits:
+            return None
+        if len(ranked) > 1 and ranked[1][1] == ranked[0][1]:
+            return None
+        return ranked[0][0]
+
+    def activate_sequences(self, container_id: int) -> None:
+        with self._lock:
+            self._active[container_id] = True
+
+    def deactivate_sequences(self, container_id: int) -> None:
+        with self._lock:
+            self._active[container_id] = False
+
+    def is_signal_present(self, signal: np.ndarray) -> Optional[int]:
+        events = self._detect_events(signal)
+        if len(events) == 0:
+            return None
+        return self._best_container(self._count_hits(self._seeds(_robust_normalize(events))))
+
+    def is_sequence_present(self, sequence: str) -> Optional[int]:
+        codes = encode(sequence)
+        return self._best_container(self._count_hits(self._seeds(self._pore_model.expected_levels(codes))))
+
+    def classify_increment(self, session: ClassificationSession, sequence: str) -> Optional[int]:
+        increment = session.take_increment(sequence, self._pore_model.k + self._seed_length)
+        codes = encode(increment)
+        for container_id, hits in self._count_hits(self._seeds(self._pore_model.expected_levels(codes))).items():
+            session.add_evidence(container_id, 0, hits, 0)
+
+        return session.decided_container(self._min_seed_hits)
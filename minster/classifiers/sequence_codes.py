@@ -0,0 +1,65 @@
+from typing import Callable, Iterator
+
+import numpy as np
+
+from minster.reference_catalog import ReferenceCatalog
+
+_REFERENCE_BLOCK_LENGTH: int = 10_000_000
+
+# A, C, G, T -> 0..3, everything else -> 4
+BASE_CODES: np.ndarray = np.full(256, 4, dtype=np.int64)
+for _code, _base in enumerate(b"ACGT"):
+    BASE_CODES[_base] = _code
+    BASE_CODES[ord(chr(_base).lower())] = _code
+
+
+def encode(sequence: str) -> np.ndarray:
+    return BASE_CODES[np.frombuffer(sequence.encode(), dtype=np.uint8)]
+
+
+def reverse_complement(codes: np.ndarray) -> np.ndarray:
+    return np.where(codes == 4, 4, 3 - codes)[::-1]
+
+
+def rolling_code(symbols: np.ndarray, base: int, length: int) -> np.ndarray:
+    """
+    Encodes every window of `length` symbols as a base-`base` number.
+    """
+    codes = np.zeros(max(0, len(symbols) - length + 1), dtype=np.uint64)
+    for offset in range(length):
+        codes = codes * np.uint64(base) + symbols[offset:len(codes) + offset].astype(np.uint64)
+    return codes
+
+
+def ambiguous_windows(codes: np.ndarray, length: int) -> np.ndarray:
+    """
+    Marks every window of `length` bases that contains a base other than A, C, G or T.
+    """
+    ambiguous = np.concatenate(([0], np.cumsum(codes == 4)))
+    return (ambiguous[length:] - ambiguous[:-length]) > 0
+
+
+def reference_blocks(sequence: str, overlap: int, both_strands: bool = False) -> Iterator[np.ndarray]:
+    """
+    Splits the base codes of a reference contig into blocks that overlap by `overlap` bases,
+    so that long contigs are never processed at once.
+    """
+    codes = encode(sequence)
+    for strand in ((codes, reverse_complement(codes)) if both_strands else (codes,)):
+        for start in range(0, max(1, len(strand) - overlap), _REFERENCE_BLOCK_LENGTH):
+            yield strand[start:start + _REFERENCE_BLOCK_LENGTH + overlap]
+
+
+def index_strata(
+        reference_catalog: ReferenceCatalog,
+        block_keys: Callable[[np.ndarray], np.ndarray],
+        overlap: int,
+        both_strands: bool = False
+) -> list[np.ndarray]:
+    """
+    The sorted distinct keys of the reference blocks of every stratum, indexed by the stratum id.
+    """
+    keys: list[list[np.ndarray]] = [[np.zeros(0, dtype=np.uint64)] for _ in reference_catalog]
+    for strata_id, sequence in reference_catalog.iter_contigs():
+        keys[strata_id].extend(block_keys(block) for block in reference_blocks(sequence, overlap, both_strands))
+    return [np.unique(np.concatenate(strata_keys)) for strata_keys in keys]
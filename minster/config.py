@@ -1,7 +1,7 @@
 from pathlib import Path
-from typing import Annotated, ClassVar, Optional
+from typing import Annotated, ClassVar, Literal, Optional
 
-from pydantic import BaseModel, model_validator, AnyUrl, confloat, conint, constr, PositiveInt, NonNegativeInt
+from pydantic import BaseModel, model_validator, AnyUrl, confloat, conint, constr, PositiveInt, NonNegativeInt, PositiveFloat
 from pydantic_settings import BaseSettings, PydanticBaseSettingsSource, TomlConfigSettingsSource
 
 UnitFloat = Annotated[float, confloat(gt=0, lt=1)]
@@ -12,7 +12,19 @@ HostName = Annotated[str, constr(max_length=253, pattern=r'^([a-z0-9-]+(\.[a-z0-
 class BasecallerSettings(BaseModel):
     config: str
     address: AnyUrl = "ipc:///tmp/.guppy/5555"
+    # read until traffic is spread across all addresses
+    additional_addresses: list[AnyUrl] = []
+    connections_per_address: PositiveInt = 1
     max_attempts: PositiveInt = 3
+    # seconds to wait for the reads of a pass before the endpoints still busy are reconnected
+    completion_timeout: PositiveFloat = 5.0
+    # None sends the entire accumulated signal of a read on every pass
+    tail_window_overlap: Optional[NonNegativeInt] = None
+    max_request_samples: Optional[PositiveInt] = None
+    max_read_samples: Optional[PositiveInt] = None
+    # submit chunks of similar signal length (power-of-two buckets) as separate batches
+    bucket_by_length: bool = False
+    max_submission_samples: Optional[PositiveInt] = None
 
 class IBFSettings(BaseModel):
     fragment_length: PositiveInt
@@ -23,18 +35,63 @@ class IBFSettings(BaseModel):
     fp_rate: UnitFloat
     preserved_pct: UnitFloat
 
+class MinimizerSketchSettings(BaseModel):
+    k: Annotated[int, conint(ge=1, le=31)] = 15
+    w: PositiveInt = 10
+    min_hits: PositiveInt = 2
+    # only minimizers whose hash is divisible by sampling are kept
+    sampling: PositiveInt = 1
+
+class AlignerProfileSettings(BaseModel):
+    preset: str = "map-ont"
+    # k and w only apply to references without a prebuilt .mmi index
+    k: Annotated[int, conint(ge=1, le=28)] = 15
+    w: Annotated[int, conint(ge=1, le=255)] = 10
+    min_cnt: PositiveInt = 2
+    min_chain_score: PositiveInt = 20
+    max_chain_skip: PositiveInt = 25
+    bw: PositiveInt = 50
+    best_n: PositiveInt = 1
+
 class MappySettings(BaseModel):
-    pass
+    # None maps every chunk against every active stratum
+    prefilter: Optional[MinimizerSketchSettings] = None
+    # None classifies with the aligners the strata balancer uses, a profile loads
+    # a second copy of every reference index
+    classification_profile: Optional[AlignerProfileSettings] = None
+    # bases at the end of the accumulated read that are mapped again while it has no hits,
+    # chains crossing the boundary of the previous pass are lost otherwise
+    undecided_tail_length: PositiveInt = 1_000
+    # matching bases (summed over the passes) a stratum needs before a read is assigned to it
+    decision_mapped_length: PositiveInt = 100
+
+class RawSignalSettings(BaseModel):
+    pore_model: Path
+    quantization_levels: Annotated[int, conint(ge=2, le=256)] = 8
+    seed_length: PositiveInt = 10
+    seed_sampling: PositiveInt = 1
+    min_seed_hits: PositiveInt = 3
+    event_window: PositiveInt = 6
+    event_threshold: PositiveFloat = 4.0
+    min_event_length: PositiveInt = 3
+
+    @model_validator(mode='after')
+    def check_seed_fits(self) -> 'RawSignalSettings':
+        if self.quantization_levels ** self.seed_length > 2 ** 64:
+            raise ValueError("quantization_levels ** seed_length must fit into 64 bits.")
+        return self
 
 class ClassifierSettings(BaseModel):
     mappy: Optional[MappySettings] = None
     interleaved_bloom_filter: Optional[IBFSettings] = None
+    raw_signal: Optional[RawSignalSettings] = None
 
     @model_validator(mode='after')
     def check_only_one_classifier(self) -> 'ClassifierSettings':
         all_classifiers: list[Optional[BaseModel]] = [
             self.mappy,
-            self.interleaved_bloom_filter
+            self.interleaved_bloom_filter,
+            self.raw_signal
         ]
 
         if sum(1 for c in all_classifiers if c is not None) > 1:
@@ -48,6 +105,18 @@ class ReadUntilSettings(BaseModel):
     classifier: ClassifierSettings
     depletion_chunks: PositiveInt = 4
     throttle: UnitFloat = 0.1
+    action_flush_interval_us: NonNegativeInt = 0
+    basecall_batch_size: PositiveInt = 1
+    # reads older than this many seconds are not basecalled anymore, None disables the check
+    decision_deadline: Optional[PositiveFloat] = None
+    # load shedding is enabled once either of these is set
+    latency_budget: Optional[PositiveFloat] = None
+    max_backlog: Optional[PositiveInt] = None
+    # what happens to the reads that do not fit into the batch while shedding load:
+    # unblocked, accepted without a decision (stop_receiving) or left for the next pass (skip)
+    shed_action: Literal["unblock", "stop_receiving", "skip"] = "unblock"
+    # the reads on these channels are basecalled last and shed first
+    low_priority_channels: list[PositiveInt] = []
 
 class SequencerSettings(BaseModel):
     name: str
@@ -57,24 +126,83 @@ class SequencerSettings(BaseModel):
 class ReferenceSequence(BaseModel):
     path: Path
     expected_ratio: PositiveInt
+    # once this many bases (or this mean coverage) are aligned, all further reads of the stratum are ejected
+    target_bases: Optional[PositiveInt] = None
+    target_coverage: Optional[PositiveFloat] = None
+
+    @model_validator(mode='after')
+    def check_single_target(self) -> 'ReferenceSequence':
+        if self.target_bases is not None and self.target_coverage is not None:
+            raise ValueError("Only one of target_bases and target_coverage can be specified.")
+        return self
+
+class ReferencePanel(BaseModel):
+    # a single FASTA with the contigs of all strata
+    path: Path
+    # tab separated lines of a contig name, its stratum and optionally the expected ratio of the stratum
+    strata_table: Path
 
 class ReadProcessorSettings(BaseModel):
     batch_size: PositiveInt
     target_base_count: PositiveInt
 
+class StratumAssignmentSettings(BaseModel):
+    # None maps entire reads
+    window_length: Optional[PositiveInt] = None
+    # 1 maps the prefix only, more windows are spread evenly along the read
+    windows: PositiveInt = 1
+    min_mapq: Annotated[int, conint(ge=0, le=60)] = 5
+    # the assignment is ambiguous if the runner-up scores (mapped length - edits) within this fraction of the best
+    ambiguity_margin: UnitFloat = 0.02
+    # the read until classifier (meant for the interleaved bloom filter) makes the first call,
+    # reads it assigns to no stratum or to different strata across the windows are mapped
+    classifier_first: bool = False
+
+    @model_validator(mode='after')
+    def check_classifier_windows(self) -> 'StratumAssignmentSettings':
+        # the classifier is shared with the read until loop, whole reads would hold it up
+        if self.classifier_first and self.window_length is None:
+            raise ValueError("classifier_first requires window_length to be set.")
+        return self
+
+class CheckpointSettings(BaseModel):
+    path: Path
+    # seconds between snapshots, one is also written on shutdown
+    interval: PositiveFloat = 60.0
+
+class WarmStartSettings(BaseModel):
+    # the metrics store of an earlier run with the same library prep
+    metrics_store: Path
+    # the fraction of the earlier run's reads the prior counts as
+    prior_weight: Annotated[float, confloat(gt=0, le=1)] = 0.1
+    # also seed the received read counts, the ratio estimation then warms up sooner
+    ratio_estimates: bool = False
+
 class ExperimentSettings(BaseSettings):
     metrics_store: Path
     minimum_reads_for_parameter_estimation: Annotated[int, confloat(gt=1)]
     minimum_fragments_for_ratio_estimation: PositiveInt
     minimum_mapped_bases: PositiveInt
     thinning_accelerator: NonNegativeInt
+    ejected_read_retention: PositiveInt = 6 * 3600
 
     read_processor: ReadProcessorSettings
-    reference_sequences: list[ReferenceSequence]
+    stratum_assignment: StratumAssignmentSettings = StratumAssignmentSettings()
+    checkpoint: Optional[CheckpointSettings] = None
+    warm_start: Optional[WarmStartSettings] = None
+    # every file is a stratum, unless the strata are given by a reference panel
+    reference_sequences: list[ReferenceSequence] = []
+    reference_panel: Optional[ReferencePanel] = None
 
     sequencer: SequencerSettings
     read_until: ReadUntilSettings
 
+    @model_validator(mode='after')
+    def check_one_reference_source(self) -> 'ExperimentSettings':
+        if (len(self.reference_sequences) > 0) == (self.reference_panel is not None):
+            raise ValueError("Either reference_sequences or reference_panel has to be specified.")
+        return self
+
     _is_toml_set: ClassVar[bool] = False
     _toml_file: ClassVar[Path]
 
@@ -1,24 +1,30 @@
 import time
 import warnings
-from typing import Iterable, NamedTuple
+from typing import Iterable, NamedTuple, Optional
 
 import numpy as np
 from minknow_api.data_pb2 import GetLiveReadsResponse
 from pybasecall_client_lib.helper_functions import package_read
-from pybasecall_client_lib.pyclient import PyBasecallClient
 
+from minster.basecall_pool import BasecallClientPool
 from minster.config import BasecallerSettings
 from read_until.base import CALIBRATION
 
+# the request fields package_read fills from a chunk, the remaining ones are fixed per channel
+_CHUNK_FIELDS = frozenset(("read_id", "raw_data", "start_time"))
+_CHANNEL_FIELDS = frozenset(("daq_offset", "daq_scaling", "sampling_rate"))
+
 
 class ReadChunk(NamedTuple):
     channel: int
     read_id: str
 
 class ReadChunkWrap:
-    def __init__(self, channel: int, read_id: str, seq: str):
+    def __init__(self, channel: int, read_id: str, seq: str, windowed: bool = False, exhausted: bool = False):
         self._read_chunk: ReadChunk = ReadChunk(channel, read_id)
         self._seq: str = seq
+        self._windowed: bool = windowed
+        self._exhausted: bool = exhausted
 
     @property
     def read_chunk(self) -> ReadChunk:
@@ -28,6 +34,78 @@ class ReadChunkWrap:
     def seq(self) -> str:
         return self._seq
 
+    @property
+    def windowed(self) -> bool:
+        """
+        True if the sequence was basecalled from a window that does not start at the
+        beginning of the read.
+        """
+        return self._windowed
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        True if the read was not basecalled because it used up its signal budget.
+        """
+        return self._exhausted
+
+
+class SignalWindow(NamedTuple):
+    start: int
+    end: int
+
+
+class SignalWindowPolicy:
+    """
+    Decides which part of the accumulated signal of a read is sent to the basecaller.
+    Without any limits the entire accumulated signal is sent on every pass. A window
+    only counts as basecalled once it is committed, a read whose result never came back
+    is sent again from where its last basecalled window ended.
+    """
+    def __init__(
+            self,
+            tail_window_overlap: Optional[int],
+            max_request_samples: Optional[int],
+            max_read_samples: Optional[int]
+    ):
+        self._tail_window_overlap: Optional[int] = tail_window_overlap
+        self._max_request_samples: Optional[int] = max_request_samples
+        self._max_read_samples: Optional[int] = max_read_samples
+        # channel -> (read id, end of the basecalled signal, samples basecalled in total)
+        self._progress: dict[int, tuple[str, int, int]] = dict()
+
+    def _get_progress(self, channel: int, read_id: str) -> tuple[int, int]:
+        previous_read_id, basecalled_end, sent_samples = self._progress.get(channel, ("", 0, 0))
+        if previous_read_id != read_id:
+            return 0, 0
+        return basecalled_end, sent_samples
+
+    def select(self, channel: int, read_id: str, accumulated_samples: int) -> Optional[SignalWindow]:
+        """
+        The window to basecall next, None once the read used up its signal budget.
+        """
+        basecalled_end, sent_samples = self._get_progress(channel, read_id)
+
+        if self._max_read_samples is not None and sent_samples >= self._max_read_samples:
+            return None
+
+        start = 0
+        if self._tail_window_overlap is not None:
+            start = max(0, basecalled_end - self._tail_window_overlap)
+        if self._max_request_samples is not None:
+            start = max(start, accumulated_samples - self._max_request_samples)
+        if self._max_read_samples is not None:
+            start = max(start, accumulated_samples - (self._max_read_samples - sent_samples))
+
+        return SignalWindow(start, accumulated_samples)
+
+    def commit(self, channel: int, read_id: str, window: SignalWindow) -> None:
+        """
+        Records the window as basecalled.
+        """
+        _, sent_samples = self._get_progress(channel, read_id)
+        self._progress[channel] = (read_id, window.end, sent_samples + window.end - window.start)
+
 
 class DoradoWrapper:
     """
@@ -37,70 +115,193 @@ class DoradoWrapper:
             self,
             basecaller_settings: BasecallerSettings,
             sampling_rate: float,
-            throttle: float
+            throttle: float,
+            calibration_values: dict[int, CALIBRATION],
+            client_pool: BasecallClientPool
     ):
         self._throttle: float = throttle
-        self._max_attempts: int = basecaller_settings.max_attempts
+        self._completion_timeout: float = basecaller_settings.completion_timeout
         self._sampling_rate: float = sampling_rate
-        self._basecall_client: PyBasecallClient = PyBasecallClient(
-            address=str(basecaller_settings.address),
-            config=basecaller_settings.config,
+
+        last_channel = max(calibration_values)
+        self._daq_offsets: np.ndarray = np.zeros(last_channel + 1, dtype=np.float64)
+        self._daq_scalings: np.ndarray = np.zeros(last_channel + 1, dtype=np.float64)
+        for channel, calibration in calibration_values.items():
+            self._daq_offsets[channel] = calibration.offset
+            self._daq_scalings[channel] = calibration.scaling
+        # the request of every channel is reused between passes, only its chunk fields are
+        # replaced; if package_read fills any other field, every request is packaged anew
+        self._packaged_reads: list[Optional[dict]] = [None] * (last_channel + 1)
+        self._reuse_requests: bool = set(self._package_new(0, "", np.zeros(0, dtype=np.int16), 0)) <= (
+            _CHUNK_FIELDS | _CHANNEL_FIELDS
         )
-        self._basecall_client.set_params({'priority': PyBasecallClient.high_priority})
-        self._basecall_client.connect()
+        self._windows: list[Optional[SignalWindow]] = [None] * (last_channel + 1)
+        self._channels: dict[str, int] = dict()
+        self._reads_to_basecall: list[tuple[int, dict]] = []
+        self._window_policy: SignalWindowPolicy = SignalWindowPolicy(
+            basecaller_settings.tail_window_overlap,
+            basecaller_settings.max_request_samples,
+            basecaller_settings.max_read_samples
+        )
+        self._bucket_by_length: bool = basecaller_settings.bucket_by_length
+        self._max_submission_samples: Optional[int] = basecaller_settings.max_submission_samples
+        self._last_round_trip: Optional[float] = None
+        self._client_pool: BasecallClientPool = client_pool
 
-    def basecall(
+    def take_round_trip(self) -> Optional[float]:
+        """
+        Seconds between passing the last batch to the basecaller and receiving all of its reads,
+        None if no batch completed since the previous call.
+        """
+        round_trip, self._last_round_trip = self._last_round_trip, None
+        return round_trip
+
+    def _form_submissions(self, packaged_reads: list[tuple[int, dict]]) -> list[tuple[int, list[dict]]]:
+        """
+        Splits the packaged reads into batches that are passed to the basecaller separately,
+        shortest first, so that short chunks are not held back by long ones. Without any
+        limits the reads are split evenly across the basecall client pool.
+        """
+        if not self._bucket_by_length and self._max_submission_samples is None:
+            by_length = sorted(packaged_reads, key=lambda item: item[0])
+            strides = min(self._client_pool.size, len(by_length))
+            return [
+                (
+                    sum(samples for samples, _ in by_length[i::strides]),
+                    [packaged_read for _, packaged_read in by_length[i::strides]]
+                )
+                for i in range(strides)
+            ]
+
+        groups: list[list[tuple[int, dict]]] = []
+        current_bucket: Optional[int] = None
+        current_samples = 0
+        for samples, packaged_read in sorted(packaged_reads, key=lambda item: item[0]):
+            bucket = samples.bit_length() if self._bucket_by_length else 0
+            if (
+                    len(groups) == 0 or
+                    bucket != current_bucket or
+                    (self._max_submission_samples is not None and
+                     current_samples + samples > self._max_submission_samples)
+            ):
+                groups.append([])
+                current_bucket = bucket
+                current_samples = 0
+            groups[-1].append((samples, packaged_read))
+            current_samples += samples
+
+        return [
+            (sum(samples for samples, _ in group), [packaged_read for _, packaged_read in group])
+            for group in groups
+        ]
+
+    def _package_new(self, channel: int, read_id: str, raw_data: np.ndarray, start_time: int) -> dict:
+        return package_read(
+            read_id=read_id,
+            raw_data=raw_data,
+            daq_offset=float(self._daq_offsets[channel]),
+            daq_scaling=float(self._daq_scalings[channel]),
+            sampling_rate=self._sampling_rate,
+            start_time=start_time
+        )
+
+    def _package_batch(
             self,
             reads: list[tuple[int, GetLiveReadsResponse.ReadData]],
-            signal_dtype: np.dtype[str],
-            calibration_values: dict[int, CALIBRATION]
-    ) -> Iterable[ReadChunkWrap]:
-        channels: dict[str, int] = dict()
-        reads_to_basecall: list[dict] = []
+            signal_dtype: np.dtype[str]
+    ) -> list[ReadChunkWrap]:
+        """
+        Packages the windows of all the reads of a pass into the reused request containers,
+        in a single pass over the reads, and returns the chunks that used up their signal budget.
+        """
+        channels = self._channels
+        reads_to_basecall = self._reads_to_basecall
+        packaged_reads = self._packaged_reads
+        channels.clear()
+        reads_to_basecall.clear()
 
+        exhausted: list[ReadChunkWrap] = []
         for channel, read in reads:
-            channels[read.id] = channel
+            # a view of the received bytes, the signal is not copied
             raw_data = np.frombuffer(read.raw_data, signal_dtype)
-            packaged_read = package_read(
-                    read_id=read.id,
-                    raw_data=raw_data,
-                    daq_offset=calibration_values[channel].offset,
-                    daq_scaling=calibration_values[channel].scaling,
-                    sampling_rate=self._sampling_rate,
-                    start_time=read.start_sample
-            )
-            reads_to_basecall.append(packaged_read)
+            window = self._window_policy.select(channel, read.id, len(raw_data))
+            if window is None:
+                exhausted.append(ReadChunkWrap(channel, read.id, "", exhausted=True))
+                continue
+
+            channels[read.id] = channel
+            self._windows[channel] = window
+            start_time = read.start_sample + window.start
+            packaged_read = packaged_reads[channel]
+            if packaged_read is None or not self._reuse_requests:
+                packaged_read = self._package_new(channel, read.id, raw_data[window.start:window.end], start_time)
+                packaged_reads[channel] = packaged_read
+            else:
+                packaged_read["read_id"] = read.id
+                packaged_read["raw_data"] = raw_data[window.start:window.end]
+                packaged_read["start_time"] = start_time
+            reads_to_basecall.append((window.end - window.start, packaged_read))
+        return exhausted
+
+    def basecall(
+            self,
+            reads: list[tuple[int, GetLiveReadsResponse.ReadData]],
+            signal_dtype: np.dtype[str]
+    ) -> Iterable[list[ReadChunkWrap]]:
+        """
+        Yields the chunks in groups as they complete, the chunks that used up their signal
+        budget first, so that decisions on a group need not wait for the rest of the pass.
+        """
+        channels = self._channels
+        reads_to_basecall = self._reads_to_basecall
+        exhausted = self._package_batch(reads, signal_dtype)
 
+        if len(exhausted) > 0:
+            yield exhausted
         if len(reads_to_basecall) == 0:
             return None
 
-        passed = False
-        for _ in range(self._max_attempts):
-            if self._basecall_client.pass_reads(reads_to_basecall):
-                passed = True
-                break
-            time.sleep(self._throttle)
-        if not passed:
-            warnings.warn("Could not pass the reads to the basecaller.")
+        t0 = time.monotonic()
+        passed_reads = 0
+        for samples, submission in self._form_submissions(reads_to_basecall):
+            if self._client_pool.submit(submission, samples):
+                passed_reads += len(submission)
+            else:
+                warnings.warn("Could not pass the reads to the basecaller.")
+        # reads passed earlier in this pass to an endpoint that was reconnected since
+        passed_reads -= self._client_pool.take_lost_reads()
+        if passed_reads <= 0:
             return None
 
         basecalled_reads = 0
-        while len(reads_to_basecall) > basecalled_reads:
-            results = self._basecall_client.get_completed_reads()
+        while passed_reads > basecalled_reads:
+            results = self._client_pool.get_completed_reads()
             if len(results) == 0:
+                if time.monotonic() - t0 > self._completion_timeout:
+                    warnings.warn(f"{passed_reads - basecalled_reads} reads were not basecalled in time.")
+                    self._client_pool.abandon_outstanding()
+                    self._client_pool.take_lost_reads()
+                    # the load shedder sees the timeout as the round trip of the pass
+                    self._last_round_trip = time.monotonic() - t0
+                    return None
                 time.sleep(self._throttle)
                 continue
 
-            for results_batch in results:
-                for result in results_batch:
-                    if result["sub_tag"] > 0:
-                        continue
+            completed: list[ReadChunkWrap] = []
+            for result in results:
+                read_id = result["metadata"]["read_id"]
+                basecalled_reads += 1
 
-                    read_id = result["metadata"]["read_id"]
-                    basecalled_reads += 1
+                channel = channels[read_id]
+                window = self._windows[channel]
+                assert window is not None
+                self._window_policy.commit(channel, read_id, window)
+                completed.append(ReadChunkWrap(
+                    channel,
+                    read_id,
+                    result["datasets"]["sequence"],
+                    windowed=window.start > 0
+                ))
+            yield completed
 
-                    yield ReadChunkWrap(
-                        channels[read_id],
-                        read_id,
-                        result["datasets"]["sequence"]
-                    )
+        self._last_round_trip = time.monotonic() - t0
@@ -1,142 +1,207 @@
 import threading
+import time
 import warnings
-from dataclasses import dataclass, field
-from math import exp, log
+from math import log
 from queue import Queue
 from typing import Optional
 
 import numpy as np
 
 from metrics.command_processor import MetricCommand
-from minster.config import ReferenceSequence
-from minster.nanopore_read import NanoporeRead
+from minster.reference_catalog import ReferenceCatalog
 
-
-@dataclass
-class EstimatorRecord:
-    """
-    This class estimates the number of bases that would have been assigned to a genome
-    if no reads had been ejected. It assumes that Nanopore read lengths are distributed
-    according to a log-normal distribution.
-    """
-    _strata_id: str
-    _minimum_fragments_for_ratio_estimation: int
-    _command_queue: Queue[Optional[MetricCommand]]
-    _log_mean_length: float = 0.0
-    _log_squared_difference: float = 0.0
-    _read_count: int = 0
-    _estimated_reads_received: int = 0
-    _consistency_lock: threading.Lock = field(default_factory=threading.Lock)
-
-    def add_entire_read(self, read: NanoporeRead) -> None:
-        log_length = log(read.get_sequence_length())
-        with self._consistency_lock:
-            # https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance
-            self._read_count += 1
-            delta = log_length - self._log_mean_length
-
-            self._log_mean_length += delta / self._read_count
-
-            delta_2 = log_length - self._log_mean_length
-            self._log_squared_difference += delta * delta_2
-
-    def get_log_mean(self) -> float:
-        return self._log_mean_length
-
-    def get_log_variance(self) -> float:
-        return (self._log_squared_difference / (self._read_count - 1)) if self._read_count > 1 else 0.0
-
-    def get_estimated_bases_received(self) -> float:
-        exponent = self.get_log_mean() + (self.get_log_variance() / 2)
-
-        if exponent >= 17:
-            warnings.warn("The mean of the distribution is very high.")
-            warnings.warn("Make sure the warm up number of reads is large enough.")
-
-        return exp(exponent) * self._estimated_reads_received
-
-    def get_estimated_reads_received(self) -> int:
-        return self._estimated_reads_received
-
-    def update_estimated_received_bases(self) -> None:
-        self._estimated_reads_received += 1
-
-    def is_ratio_estimation_warmed_up(self) -> bool:
-        return self._estimated_reads_received >= self._minimum_fragments_for_ratio_estimation
+# rows of the log read length moments
+_COUNT, _MEAN, _SQUARED_DIFFERENCE = 0, 1, 2
+# seconds, the received bases of a stratum counted for less are compared as if counted for this long
+_MIN_EXPOSURE = 1.0
 
 
 class EstimatorManager:
     """
-    Uses the estimator of the number of bases (see EstimatorRecord) to determine
-    the probability with which reads classified as originating from a genome (stratum)
-    are ejected.
+    Estimates the number of bases that would have been assigned to every genome (stratum)
+    if no reads had been ejected, assuming that Nanopore read lengths are distributed
+    according to a log-normal distribution, and uses the estimates to determine the
+    probability with which reads classified as originating from a stratum are ejected.
+    The state of all strata is kept in arrays indexed by the stratum id. Every stratum
+    starts counting its received reads when it warms up, so the strata are compared by
+    the bases they received per second since then.
     """
     def __init__(
             self,
-            reference_sequences: list[ReferenceSequence],
+            reference_catalog: ReferenceCatalog,
             minimum_fragments_for_ratio_estimation: int,
             beta: int,
             command_queue: Queue[Optional[MetricCommand]]
     ):
-        self._target_ratios: dict[str, int] = {str(rs.path):rs.expected_ratio for rs in reference_sequences}
+        strata_count = len(reference_catalog)
+        self._target_ratios: np.ndarray = np.array([entry.expected_ratio for entry in reference_catalog], dtype=np.float64)
         self._beta: int = beta
-        self._observed_bases: dict[str, int] = {str(rs.path):0 for rs in reference_sequences}
-        self._estimator_records: dict[str, EstimatorRecord] = {
-            str(rs.path):EstimatorRecord(
-                str(rs.path),
-                minimum_fragments_for_ratio_estimation,
-                command_queue
-            )
-            for rs in reference_sequences
-        }
+        self._minimum_fragments_for_ratio_estimation: int = minimum_fragments_for_ratio_estimation
+        self._observed_bases: np.ndarray = np.zeros(strata_count, dtype=np.int64)
+        # count, mean and sum of squared differences of the log read lengths,
+        # replaced as a whole on every update so that readers see consistent moments
+        self._log_moments: np.ndarray = np.zeros((3, strata_count), dtype=np.float64)
+        self._estimated_reads_received: np.ndarray = np.zeros(strata_count, dtype=np.int64)
+        # the monotonic time every stratum started counting its received reads at, NaN until then
+        self._exposure_started: np.ndarray = np.full(strata_count, np.nan, dtype=np.float64)
+        self._update_lock: threading.Lock = threading.Lock()
         self._command_queue: Queue[Optional[MetricCommand]] = command_queue
 
-    def are_all_warmed_up(self) -> bool:
-        return all(
-            val.is_ratio_estimation_warmed_up() for val in self._estimator_records.values()
+    def is_warmed_up(self, strata_id: int) -> bool:
+        return bool(self._estimated_reads_received[strata_id] >= self._minimum_fragments_for_ratio_estimation)
+
+    def get_read_counts(self) -> np.ndarray:
+        return self._log_moments[_COUNT]
+
+    @staticmethod
+    def _log_variances(log_moments: np.ndarray) -> np.ndarray:
+        counts = log_moments[_COUNT]
+        return np.divide(
+            log_moments[_SQUARED_DIFFERENCE],
+            counts - 1,
+            out=np.zeros_like(counts),
+            where=counts > 1
         )
 
-    def get_acceptance_rate(self, strata_id: str) -> float:
-        keys = sorted(self._estimator_records)
+    def start_exposure(self, strata_id: int) -> None:
+        if np.isnan(self._exposure_started[strata_id]):
+            self._exposure_started[strata_id] = time.monotonic()
 
-        ordered_estimated_received_bases = np.array([self._estimator_records[key].get_estimated_bases_received() for key in keys])
-        total_estimated_received_bases = np.sum(ordered_estimated_received_bases)
+    def get_exposures(self) -> np.ndarray:
+        """
+        The seconds every stratum has been counting its received reads for, 0 if it has not started.
+        """
+        return np.nan_to_num(time.monotonic() - self._exposure_started, nan=0.0)
 
-        ordered_target_ratios = np.array([self._target_ratios[k] for k in keys])
-        target_whole = np.sum(ordered_target_ratios)
-        ordered_target_proportions = ordered_target_ratios / target_whole
+    def get_estimated_bases_received(self) -> np.ndarray:
+        log_moments = self._log_moments
+        exponents = log_moments[_MEAN] + self._log_variances(log_moments) / 2
 
-        # b_hat / r
-        representation = (
-                (ordered_estimated_received_bases * target_whole) /
-                (ordered_target_ratios * total_estimated_received_bases)
-        )
-        min_index = np.argmin(representation)
-
-        target_part = self._target_ratios[strata_id]
-        estimated_received_part = self._estimator_records[strata_id].get_estimated_bases_received()
-        # min_i(b_hat,i / r_i) * (r / b_hat)
-        acceptance_rate = (
-                (target_part * ordered_estimated_received_bases[min_index]) /
-                (ordered_target_ratios[min_index] * estimated_received_part)
-        )
+        if np.any(exponents >= 17):
+            warnings.warn("The mean of the distribution is very high.")
+            warnings.warn("Make sure the warm up number of reads is large enough.")
+
+        return np.exp(exponents) * self._estimated_reads_received
 
-        ordered_observed_bases = np.array([self._observed_bases[key] for key in keys])
-        total_observed_bases = np.sum(ordered_observed_bases)
-        ordered_observed_proportions = ordered_observed_bases / total_observed_bases
+    def get_acceptance_rates(self, strata_mask: np.ndarray) -> np.ndarray:
+        """
+        The acceptance rates of reads from every stratum balanced among the strata selected
+        by the mask, reads from the other strata are always accepted.
+        """
+        acceptance_rates = np.ones(len(self._target_ratios), dtype=np.float64)
+        if not np.any(strata_mask):
+            return acceptance_rates
 
-        distance = 0.5 * np.sum(np.abs(np.subtract(ordered_observed_proportions, ordered_target_proportions)))
+        estimated_received_bases = self.get_estimated_bases_received()[strata_mask]
+        target_ratios = self._target_ratios[strata_mask]
+        target_proportions = target_ratios / np.sum(target_ratios)
+
+        # min_i(b_hat,i / r_i) * (r / b_hat), with b_hat the bases received per second of exposure
+        exposures = np.maximum(self.get_exposures()[strata_mask], _MIN_EXPOSURE)
+        representation = estimated_received_bases / exposures / target_ratios
+        acceptance = np.min(representation) / representation
+
+        observed_bases = self._observed_bases[strata_mask]
+        observed_proportions = observed_bases / np.sum(observed_bases)
+
+        distance = 0.5 * np.sum(np.abs(np.subtract(observed_proportions, target_proportions)))
         distance = min(distance, 1 - 1e-5)
         alpha = max(
             1.0,
             -1 * log(1 - distance) * self._beta
         )
 
-        return float(acceptance_rate) ** alpha
+        acceptance_rates[strata_mask] = acceptance ** alpha
+        return acceptance_rates
+
+    def get_acceptance_rate(self, strata_id: int, strata_mask: np.ndarray) -> float:
+        return float(self.get_acceptance_rates(strata_mask)[strata_id])
 
-    def update_estimated_received_bases(self, strata_id: str) -> None:
-        self._estimator_records[strata_id].update_estimated_received_bases()
+    def export_state(self) -> dict[str, np.ndarray]:
+        return {
+            "observed_bases": self._observed_bases.copy(),
+            "log_moments": self._log_moments,
+            "estimated_reads_received": self._estimated_reads_received.copy(),
+            # the monotonic time does not carry over to another process, the exposure does
+            "exposures": time.monotonic() - self._exposure_started
+        }
 
-    def add_entire_read(self, strata_id: str, read: NanoporeRead) -> None:
-        self._observed_bases[strata_id] += read.get_sequence_length()
-        self._estimator_records[strata_id].add_entire_read(read)
+    def restore_state(self, state: dict[str, np.ndarray]) -> None:
+        with self._update_lock:
+            self._observed_bases = state["observed_bases"].astype(np.int64)
+            self._log_moments = state["log_moments"].astype(np.float64)
+            self._estimated_reads_received = state["estimated_reads_received"].astype(np.int64)
+            self._exposure_started = time.monotonic() - state["exposures"].astype(np.float64)
+
+    def update_estimated_received_bases(self, strata_id: int) -> None:
+        self._estimated_reads_received[strata_id] += 1
+
+    def _batch_moments(self, strata_ids: np.ndarray, read_lengths: np.ndarray) -> np.ndarray:
+        strata_count = len(self._target_ratios)
+        log_lengths = np.log(read_lengths.astype(np.float64))
+        batch_counts = np.bincount(strata_ids, minlength=strata_count).astype(np.float64)
+        batch_means = np.divide(
+            np.bincount(strata_ids, weights=log_lengths, minlength=strata_count),
+            batch_counts,
+            out=np.zeros(strata_count, dtype=np.float64),
+            where=batch_counts > 0
+        )
+        batch_squared_differences = np.bincount(
+            strata_ids,
+            weights=(log_lengths - batch_means[strata_ids]) ** 2,
+            minlength=strata_count
+        )
+        return np.stack((batch_counts, batch_means, batch_squared_differences))
+
+    def _merge_moments(self, batch_moments: np.ndarray) -> None:
+        """
+        Must be called with the update lock held.
+        """
+        # https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+        counts, means, squared_differences = self._log_moments
+        batch_counts, batch_means, batch_squared_differences = batch_moments
+        merged_counts = counts + batch_counts
+        delta = batch_means - means
+        weights = np.divide(batch_counts, merged_counts, out=np.zeros_like(counts), where=merged_counts > 0)
+        self._log_moments = np.stack((
+            merged_counts,
+            means + delta * weights,
+            squared_differences + batch_squared_differences + delta ** 2 * counts * weights
+        ))
+
+    def add_reads(self, strata_ids: np.ndarray, read_lengths: np.ndarray) -> None:
+        """
+        Merges the log read lengths of a batch of reads into the moments of their strata.
+        """
+        if len(strata_ids) == 0:
+            return
+
+        batch_moments = self._batch_moments(strata_ids, read_lengths)
+        with self._update_lock:
+            np.add.at(self._observed_bases, strata_ids, read_lengths)
+            self._merge_moments(batch_moments)
+
+    def add_prior(
+            self,
+            strata_ids: np.ndarray,
+            read_lengths: np.ndarray,
+            prior_weight: float,
+            reads_received: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Seeds the estimators with the reads of an earlier run, counted as `prior_weight` of
+        a read each, so that the log-length means and variances are kept but new reads
+        outweigh them quickly. With the number of reads the earlier run received, the
+        received counts are seeded as well; the observed bases are not, they are only ever
+        counted from the reads of this run.
+        """
+        if len(strata_ids) == 0:
+            return
+
+        prior_moments = self._batch_moments(strata_ids, read_lengths)
+        prior_moments[_COUNT] *= prior_weight
+        prior_moments[_SQUARED_DIFFERENCE] *= prior_weight
+        with self._update_lock:
+            self._merge_moments(prior_moments)
+            if reads_received is not None:
+                self._estimated_reads_received += np.rint(reads_received * prior_weight).astype(np.int64)
@@ -39,9 +39,22 @@ class ExperimentManager:
         return self._protocol.get_run_info().output_path
 
     def parse_fastq_file(self, fastq_path: str) -> None:
-        for record in pyfastx.Fastq(fastq_path):
-            fastq_read = ReadDirector(record, fastq_path).construct_read()
-
-            if not fastq_read.get_is_pass():
-                return None
-            self._read_processor.add_read(fastq_read)
+        # a file is parsed once, a resumed run has already ingested the files of its checkpoint
+        # and skips the records of partly ingested files whose reads it processed
+        processed_records = self._read_processor.claim_file(fastq_path)
+        if processed_records is None:
+            return None
+
+        try:
+            for record_number, record in enumerate(pyfastx.Fastq(fastq_path), start=1):
+                if record_number <= processed_records:
+                    continue
+                fastq_read = ReadDirector(record, fastq_path).construct_read()
+
+                if not fastq_read.get_is_pass():
+                    break
+                self._read_processor.add_read(fastq_read, record_number)
+        except Exception:
+            self._read_processor.release_file(fastq_path)
+            raise
+        self._read_processor.add_parsed_file(fastq_path)
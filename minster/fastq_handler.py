@@ -5,6 +5,8 @@ from watchdog.events import FileSystemEventHandler, DirCreatedEvent, FileCreated
 
 from minster.experiment_manager import ExperimentManager
 
+FASTQ_SUFFIXES: tuple[str, ...] = (".fastq", ".fastq.gz", ".fq", ".fq.gz")
+
 
 class FastqHandler(FileSystemEventHandler):
     def __init__(self, experiment_manager: ExperimentManager):
@@ -13,20 +15,23 @@ class FastqHandler(FileSystemEventHandler):
     def on_created(self, event: DirCreatedEvent | FileCreatedEvent) -> None:
         if event.is_directory:
             return None
-        if not (
-            event.src_path.endswith(".fastq") or
-            event.src_path.endswith(".fastq.gz") or
-            event.src_path.endswith(".fq") or
-            event.src_path.endswith(".fq.gz")
-        ):
+        if not event.src_path.endswith(FASTQ_SUFFIXES):
             return None
+        self.ingest([event.src_path])
 
+    def ingest(self, fastq_paths: list[str]) -> None:
+        """
+        Parses every file once its size stops changing, MinKNOW may still be writing it.
+        """
         # not using inotify for compatibility purposes
-        while True:
-            initial_size = os.path.getsize(event.src_path)
+        sizes = {fastq_path: os.path.getsize(fastq_path) for fastq_path in fastq_paths}
+        while len(sizes) > 0:
             time.sleep(5)
-            new_size = os.path.getsize(event.src_path)
+            for fastq_path, size in list(sizes.items()):
+                new_size = os.path.getsize(fastq_path)
+                if new_size != size:
+                    sizes[fastq_path] = new_size
+                    continue
 
-            if initial_size == new_size:
-                break
-        self._experiment_manager.parse_fastq_file(event.src_path)
+                del sizes[fastq_path]
+                self._experiment_manager.parse_fastq_file(fastq_path)
@@ -1,19 +1,126 @@
+import hashlib
 import threading
+import time
+import uuid
+from typing import NamedTuple
+
+import numpy as np
+
+_LOW_MASK = (1 << 64) - 1
+
+
+class EjectedGeneration(NamedTuple):
+    """
+    An immutable block of ejected read ids, stored as 128-bit integers split
+    into their high and low 64-bit halves and sorted by (high, low).
+    """
+    started: float
+    high: np.ndarray
+    low: np.ndarray
+
+    def __contains__(self, key: int) -> bool:
+        high = np.uint64(key >> 64)
+        start = int(np.searchsorted(self.high, high, side="left"))
+        end = int(np.searchsorted(self.high, high, side="right"))
+        return start != end and bool(np.any(self.low[start:end] == np.uint64(key & _LOW_MASK)))
 
 
 class FragmentCollection:
     """
     A collection of all fragments that were ejected. It is maintained to prevent
     their basecalled counterparts from distorting the estimators.
+
+    Read ids are kept as 128-bit integers. Recently ejected ids live in a set
+    which is sealed into a sorted array every `retention / generations`
+    seconds; sealed arrays older than `retention` are dropped, as the FASTQ
+    records of their reads can no longer arrive. Only writers take the lock,
+    lookups read immutable snapshots.
     """
-    def __init__(self) -> None:
-        self._ejected_ids: set[str] = set()
+    def __init__(self, retention: float = 6 * 3600, generations: int = 8) -> None:
+        self._generation_span: float = retention / generations
+        self._retention: float = retention
+        self._recent_ids: set[int] = set()
+        self._recent_started: float = time.monotonic()
+        self._sealed: tuple[EjectedGeneration, ...] = tuple()
         self._lock: threading.Lock = threading.Lock()
 
+    @staticmethod
+    def _encode(read_id: str) -> int:
+        try:
+            return uuid.UUID(read_id).int
+        except ValueError:
+            return int.from_bytes(hashlib.blake2b(read_id.encode(), digest_size=16).digest(), "big")
+
+    def _recent_generation(self) -> EjectedGeneration:
+        keys = np.array(
+            [(key >> 64, key & _LOW_MASK) for key in self._recent_ids],
+            dtype=np.uint64
+        ).reshape(-1, 2)
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        return EjectedGeneration(
+            self._recent_started,
+            np.ascontiguousarray(keys[order, 0]),
+            np.ascontiguousarray(keys[order, 1])
+        )
+
+    def _seal(self, now: float) -> None:
+        if len(self._recent_ids) == 0:
+            self._recent_started = now
+            return
+
+        generation = self._recent_generation()
+
+        # publish the sealed generation before dropping the recent set
+        self._sealed = tuple(
+            g for g in self._sealed if g.started + self._generation_span + self._retention > now
+        ) + (generation,)
+        self._recent_ids = set()
+        self._recent_started = now
+
     def add_ejected(self, read_id: str) -> None:
+        key = FragmentCollection._encode(read_id)
         with self._lock:
-            self._ejected_ids.add(read_id)
+            now = time.monotonic()
+            if now - self._recent_started >= self._generation_span:
+                self._seal(now)
+            self._recent_ids.add(key)
 
-    def was_ejected(self, read_id: str) -> bool:
+    def export_state(self) -> dict[str, np.ndarray]:
+        """
+        All generations, the recent one included, with their age instead of the monotonic
+        time they were started at, which does not carry over to another process.
+        """
         with self._lock:
-            return read_id in self._ejected_ids
\ No newline at end of file
+            now = time.monotonic()
+            sealed = self._sealed + (self._recent_generation(),)
+        return {
+            "ejected_ages": np.array([now - g.started for g in sealed], dtype=np.float64),
+            "ejected_sizes": np.array([len(g.high) for g in sealed], dtype=np.int64),
+            "ejected_high": np.concatenate([np.zeros(0, dtype=np.uint64), *(g.high for g in sealed)]),
+            "ejected_low": np.concatenate([np.zeros(0, dtype=np.uint64), *(g.low for g in sealed)])
+        }
+
+    def restore_state(self, state: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            offsets = np.concatenate(([0], np.cumsum(state["ejected_sizes"])))
+            self._sealed = tuple(
+                EjectedGeneration(
+                    now - age,
+                    state["ejected_high"][start:end].astype(np.uint64),
+                    state["ejected_low"][start:end].astype(np.uint64)
+                )
+                for age, start, end in zip(state["ejected_ages"].tolist(), offsets[:-1], offsets[1:])
+                if age < self._generation_span + self._retention
+            )
+            self._recent_ids = set()
+            self._recent_started = now
+
+    def was_ejected(self, read_id: str) -> bool:
+        key = FragmentCollection._encode(read_id)
+        if key in self._recent_ids:
+            return True
+        return any(key in generation for generation in self._sealed)
+
+    def __len__(self) -> int:
+        return len(self._recent_ids) + sum(len(g.high) for g in self._sealed)
@@ -3,6 +3,7 @@ from collections import defaultdict
 from collections import deque
 from typing import Optional
 
+from minster.checkpoint import Checkpointer
 from minster.classifiers.classifier import Classifier
 from minster.config import ReadProcessorSettings
 from minster.fragment_collection import FragmentCollection
@@ -21,30 +22,81 @@ class ReadProcessor:
             classifier: Classifier,
             strata_balancer: StrataBalancer,
             fragment_collection: FragmentCollection,
-            read_processor_settings: ReadProcessorSettings
+            read_processor_settings: ReadProcessorSettings,
+            checkpointer: Optional[Checkpointer] = None
     ):
         self._batch_size: int = read_processor_settings.batch_size
         self._target_base_count: int = read_processor_settings.target_base_count
         self._read_count: int = 0
         self._base_count: int = 0
-        self._queue: deque[Optional[NanoporeRead]] = deque()
+        # every read is queued with the number of records of its FASTQ file up to and including it
+        self._queue: deque[Optional[tuple[NanoporeRead, int]]] = deque()
         self._condition: threading.Condition = threading.Condition()
         self._fragment_collection: FragmentCollection = fragment_collection
         self._strata_balancer: StrataBalancer = strata_balancer
         self._classifier: Classifier = classifier
-        self._classifiers_activated: bool = False
+        self._activated_strata: set[int] = set()
+        self._checkpointer: Optional[Checkpointer] = checkpointer
+        # the reads are processed in the order they were added, a FASTQ file is ingested
+        # once as many reads were processed as had been added when it was parsed
+        self._added_reads: int = 0
+        self._processed_reads: int = 0
+        self._parsed_files: deque[tuple[int, str]] = deque()
+        self._ingested_files: list[str] = []
+        self._known_files: set[str] = set()
+        # the records of the files not ingested yet whose reads were processed, a resumed run skips them
+        self._processed_records: dict[str, int] = dict()
+        # the records of the files not ingested yet whose reads were queued, a released file skips them
+        self._queued_records: dict[str, int] = dict()
 
     def quit(self) -> None:
         with self._condition:
             self._queue.appendleft(None)
             self._condition.notify()
 
-    def add_read(self, read: NanoporeRead) -> None:
+    def resume(self, ingested_files: list[str], processed_records: dict[str, int]) -> None:
+        """
+        Continues from a restored checkpoint, must be called before processing starts.
+        """
+        self._ingested_files = list(ingested_files)
+        self._known_files = set(ingested_files)
+        self._processed_records = dict(processed_records)
+        self._activate_strata()
+
+    def claim_file(self, fastq_path: str) -> Optional[int]:
+        """
+        None if the file was ingested or is being parsed already, otherwise it is claimed for
+        parsing and the number of its leading records whose reads were processed is returned.
+        """
+        with self._condition:
+            if fastq_path in self._known_files:
+                return None
+            self._known_files.add(fastq_path)
+            return self._queued_records.get(fastq_path, self._processed_records.get(fastq_path, 0))
+
+    def release_file(self, fastq_path: str) -> None:
+        """
+        Gives up the claim on a file that could not be parsed, so that it is parsed again when
+        seen next, from the first record whose read was not queued.
+        """
+        with self._condition:
+            self._known_files.discard(fastq_path)
+
+    def add_parsed_file(self, fastq_path: str) -> None:
+        with self._condition:
+            self._parsed_files.append((self._added_reads, fastq_path))
+
+    def add_read(self, read: NanoporeRead, file_records: int) -> None:
+        """
+        `file_records` is the number of records of the read's FASTQ file up to and including it.
+        """
         if self._fragment_collection.was_ejected(read.get_read_id()):
             return
 
         with self._condition:
-            self._queue.append(read)
+            self._queue.append((read, file_records))
+            self._queued_records[read.get_fastq_file_path()] = file_records
+            self._added_reads += 1
 
             self._base_count += read.get_sequence_length()
             self._read_count += 1
@@ -58,26 +110,51 @@ class ReadProcessor:
                 self._condition.wait()
 
                 breaking = False
-                batch: list[NanoporeRead] = []
+                batch: list[tuple[NanoporeRead, int]] = []
 
                 while len(self._queue) > 0:
-                    read = self._queue.popleft()
-                    if read is None:
+                    item = self._queue.popleft()
+                    if item is None:
                         breaking = True
                         break
 
                     self._read_count -= 1
-                    self._base_count -= read.get_sequence_length()
+                    self._base_count -= item[0].get_sequence_length()
 
-                    batch.append(read)
+                    batch.append(item)
 
             if breaking:
                 break
 
-            self._strata_balancer.update_alignments(batch)
+            self._strata_balancer.update_alignments([read for read, _ in batch])
+            self._update_ingested_files(batch)
+            self._activate_strata()
+
+            if self._checkpointer is not None and self._checkpointer.is_due():
+                self._checkpointer.save(self._ingested_files, self._processed_records)
 
-            if self._classifiers_activated or not self._strata_balancer.are_all_warmed_up():
+        if self._checkpointer is not None:
+            self._checkpointer.save(self._ingested_files, self._processed_records)
+
+    def _update_ingested_files(self, batch: list[tuple[NanoporeRead, int]]) -> None:
+        with self._condition:
+            # the reads of a file are processed in the order of its records
+            for read, file_records in batch:
+                self._processed_records[read.get_fastq_file_path()] = file_records
+
+            self._processed_reads += len(batch)
+            while len(self._parsed_files) > 0 and self._parsed_files[0][0] <= self._processed_reads:
+                fastq_path = self._parsed_files.popleft()[1]
+                self._ingested_files.append(fastq_path)
+                self._processed_records.pop(fastq_path, None)
+                self._queued_records.pop(fastq_path, None)
+
+    def _activate_strata(self) -> None:
+        # every stratum is classified as soon as its own warm up finishes or it reaches its target
+        for strata_id in self._strata_balancer.get_all_strata():
+            if strata_id in self._activated_strata or not (
+                    self._strata_balancer.is_warmed_up(strata_id) or self._strata_balancer.is_completed(strata_id)
+            ):
                 continue
-            for strata_id in self._strata_balancer.get_all_strata():
-                self._classifier.activate_sequences(strata_id)
-            self._classifiers_activated = True
+            self._classifier.activate_sequences(strata_id)
+            self._activated_strata.add(strata_id)
@@ -1,22 +1,34 @@
 import time
-from collections import defaultdict
 from queue import Queue
 from timeit import default_timer as timer
-from typing import Iterable, Optional
+from typing import Iterable, NamedTuple, Optional
 
-from metrics.command_processor import MetricCommand, RecordClassifiedReadCommand
-from minster.classifiers.classifier import Classifier
+import numpy as np
+from minknow_api.data_pb2 import GetLiveReadsResponse
+
+from metrics.command_processor import MetricCommand, RecordClassifiedReadCommand, RecordEventCommand
+from minster.basecall_pool import BasecallClientPool
+from minster.chunk_scheduler import ChunkScheduler, LoadShedder, ScheduledChunks
+from minster.classifiers.classifier import Classifier, ClassificationSession, SignalClassifier
 from minster.config import ReadUntilSettings
-from minster.dorado_wrapper import DoradoWrapper, ReadChunk, ReadChunkWrap
+from minster.dorado_wrapper import DoradoWrapper, ReadChunk
 from minster.fragment_collection import FragmentCollection
+from minster.reference_catalog import ReferenceCatalog
 from minster.strata_balancer import StrataBalancer
 from read_until import ReadUntilClient, AccumulatingCache
 
 
+class ClassifiedChunk(NamedTuple):
+    read_chunk: ReadChunk
+    category: Optional[int]
+    exhausted: bool = False
+
+
 class ReadUntilRegulator:
     """
     This class interfaces with a basecaller, a classifier, and a balancer to eject
-    the reads originating from overrepresented genomes (strata).
+    the reads originating from overrepresented genomes (strata). Classifiers that
+    work on the raw signal are used without the basecaller.
     """
     def __init__(
             self,
@@ -25,6 +37,7 @@ class ReadUntilRegulator:
             classifier: Classifier,
             strata_balancer: StrataBalancer,
             fragment_collection: FragmentCollection,
+            reference_catalog: ReferenceCatalog,
             command_queue: Queue[Optional[MetricCommand]]
     ):
         print("Initializing the Read Until Client")
@@ -34,68 +47,197 @@ class ReadUntilRegulator:
             one_chunk=False,
             cache_type=AccumulatingCache
         )
-        print("Initializing the Basecaller")
-        self._basecaller: DoradoWrapper = DoradoWrapper(
-            read_until_settings.basecaller,
+        self._signal_classifier: Optional[SignalClassifier] = (
+            classifier if isinstance(classifier, SignalClassifier) else None
+        )
+        self._basecaller: Optional[DoradoWrapper] = None
+        if self._signal_classifier is None:
+            print("Initializing the Basecaller")
+            self._basecaller = DoradoWrapper(
+                read_until_settings.basecaller,
+                sampling_rate,
+                read_until_settings.throttle,
+                self._read_until_client.calibration_values,
+                BasecallClientPool(read_until_settings.basecaller, read_until_settings.throttle, command_queue)
+            )
+        self._chunk_scheduler: ChunkScheduler = ChunkScheduler(
             sampling_rate,
-            read_until_settings.throttle
+            read_until_settings.decision_deadline,
+            read_until_settings.low_priority_channels
         )
+        self._load_shedder: LoadShedder = LoadShedder(
+            read_until_settings.basecall_batch_size,
+            read_until_settings.latency_budget,
+            read_until_settings.max_backlog
+        )
+        self._shed_action: str = read_until_settings.shed_action
         self._depletion_chunks: int = read_until_settings.depletion_chunks
+        self._action_flush_interval_us: int = read_until_settings.action_flush_interval_us
         self._throttle: float = read_until_settings.throttle
         self._classifier: Classifier = classifier
         self._fragment_collection: FragmentCollection = fragment_collection
         self._strata_balancer: StrataBalancer = strata_balancer
+        self._reference_catalog: ReferenceCatalog = reference_catalog
         self._command_queue: Queue[Optional[MetricCommand]] = command_queue
 
     def run(self) -> None:
-        self._read_until_client.run()
+        self._read_until_client.run(
+            action_flush_interval_us=self._action_flush_interval_us
+        )
 
     def reset(self) -> None:
         self._read_until_client.reset()
 
+    def _classify_basecalled(
+            self,
+            basecaller: DoradoWrapper,
+            reads: list[tuple[int, GetLiveReadsResponse.ReadData]],
+            sessions: list[Optional[ClassificationSession]]
+    ) -> Iterable[list[ClassifiedChunk]]:
+        for chunk_wraps in basecaller.basecall(reads, self._read_until_client.signal_dtype):
+            classified_chunks: list[ClassifiedChunk] = []
+            for chunk_wrap in chunk_wraps:
+                read_chunk = chunk_wrap.read_chunk
+                if chunk_wrap.exhausted:
+                    classified_chunks.append(ClassifiedChunk(read_chunk, None, exhausted=True))
+                    continue
+
+                session = sessions[read_chunk.channel]
+                if session is None or session.read_id != read_chunk.read_id:
+                    session = ClassificationSession(read_chunk.read_id)
+                    sessions[read_chunk.channel] = session
+                if chunk_wrap.windowed:
+                    session.mark_windowed()
+                classified_chunks.append(
+                    ClassifiedChunk(read_chunk, self._classifier.classify_increment(session, chunk_wrap.seq))
+                )
+            yield classified_chunks
+
+    def _classify_signal(
+            self,
+            signal_classifier: SignalClassifier,
+            reads: list[tuple[int, GetLiveReadsResponse.ReadData]]
+    ) -> Iterable[list[ClassifiedChunk]]:
+        signal_dtype = self._read_until_client.signal_dtype
+        yield [
+            ClassifiedChunk(
+                ReadChunk(channel, read.id),
+                signal_classifier.is_signal_present(np.frombuffer(read.raw_data, signal_dtype))
+            )
+            for channel, read in reads
+        ]
+
     def run_regulation_loop(self) -> None:
-        fragments_count: dict[str, int] = defaultdict(int)
+        # undecided fragments seen per channel, reset whenever a new read appears on the channel
+        last_channel = self._read_until_client.last_channel
+        fragments_read_ids: list[Optional[str]] = [None] * (last_channel + 1)
+        fragments_count: list[int] = [0] * (last_channel + 1)
+        # classification state of the undecided read on each channel
+        sessions: list[Optional[ClassificationSession]] = [None] * (last_channel + 1)
 
         while self._read_until_client.is_running:
             t0 = timer()
             stop_receiving_batch: list[ReadChunk] = []
             unblock_batch: list[ReadChunk] = []
 
-            basecalled_reads: Iterable[ReadChunkWrap] = self._basecaller.basecall(
-                # self._read_until_client.channel_count
-                self._read_until_client.get_read_chunks(1, last=True),
+            # without a basecaller every pending chunk is classified on every pass,
+            # skipped chunks simply wait for the next pass
+            scheduled: ScheduledChunks = self._chunk_scheduler.schedule(
+                self._read_until_client.get_read_chunks(self._read_until_client.channel_count, last=True),
                 self._read_until_client.signal_dtype,
-                self._read_until_client.calibration_values
+                self._load_shedder.batch_size if self._basecaller is not None else self._read_until_client.channel_count,
+                self._load_shedder.overloaded and self._shed_action != "skip"
             )
-
-            for chunk_wrap in basecalled_reads:
-                read_chunk = chunk_wrap.read_chunk
-                matched_cat_id = self._classifier.is_sequence_present(chunk_wrap.seq)
-                self._command_queue.put(
-                    RecordClassifiedReadCommand(read_chunk.read_id, matched_cat_id)
-                )
-
-                clean_up_p = False
-                if matched_cat_id is not None:
-                    self._strata_balancer.update_estimated_received_bases(matched_cat_id)
-                    if self._strata_balancer.thin_out_p(matched_cat_id):
-                        self._fragment_collection.add_ejected(read_chunk.read_id)
-                        unblock_batch.append(read_chunk)
-                    else:
-                        stop_receiving_batch.append(read_chunk)
-                    clean_up_p = True
+            if len(scheduled.shed) > 0:
+                if self._shed_action == "unblock":
+                    unblock_batch.extend(scheduled.shed)
+                    for shed_chunk in scheduled.shed:
+                        self._fragment_collection.add_ejected(shed_chunk.read_id)
                 else:
-                    fragments_count[read_chunk.read_id] += 1
-                    if fragments_count[read_chunk.read_id] >= self._depletion_chunks:
-                        stop_receiving_batch.append(read_chunk)
-                        clean_up_p = True
-
-                if clean_up_p:
-                    fragments_count.pop(read_chunk.read_id, None)
+                    stop_receiving_batch.extend(scheduled.shed)
+                for shed_chunk in scheduled.shed:
+                    sessions[shed_chunk.channel] = None
+                self._command_queue.put(RecordEventCommand("shed_read", len(scheduled.shed)))
+            if len(scheduled.expired) > 0:
+                stop_receiving_batch.extend(scheduled.expired)
+                for expired_chunk in scheduled.expired:
+                    sessions[expired_chunk.channel] = None
+                self._command_queue.put(RecordEventCommand("deadline_miss", len(scheduled.expired)))
 
+            # the shed and expired chunks are decided already
             self._read_until_client.unblock_read_batch(unblock_batch)
             self._read_until_client.stop_receiving_batch(stop_receiving_batch)
 
+            classified_groups: Iterable[list[ClassifiedChunk]]
+            if self._signal_classifier is not None:
+                classified_groups = self._classify_signal(self._signal_classifier, scheduled.to_basecall)
+            else:
+                assert self._basecaller is not None
+                classified_groups = self._classify_basecalled(self._basecaller, scheduled.to_basecall, sessions)
+
+            # the decisions on every group are sent as soon as it is classified
+            for classified_chunks in classified_groups:
+                self._decide(classified_chunks, sessions, fragments_read_ids, fragments_count)
+
+            round_trip = None if self._basecaller is None else self._basecaller.take_round_trip()
+            if self._load_shedder.observe(round_trip, self._chunk_scheduler.get_backlog()):
+                self._command_queue.put(RecordEventCommand("shrink_batch"))
+
             t1 = timer()
             if t0 + self._throttle > t1:
                 time.sleep(self._throttle + t0 - t1)
+
+    def _decide(
+            self,
+            classified_chunks: list[ClassifiedChunk],
+            sessions: list[Optional[ClassificationSession]],
+            fragments_read_ids: list[Optional[str]],
+            fragments_count: list[int]
+    ) -> None:
+        stop_receiving_batch: list[ReadChunk] = []
+        unblock_batch: list[ReadChunk] = []
+        completed_ejections = 0
+
+        for classified_chunk in classified_chunks:
+            read_chunk = classified_chunk.read_chunk
+            channel = read_chunk.channel
+            if fragments_read_ids[channel] != read_chunk.read_id:
+                fragments_read_ids[channel] = read_chunk.read_id
+                fragments_count[channel] = 0
+
+            if classified_chunk.exhausted:
+                stop_receiving_batch.append(read_chunk)
+                sessions[channel] = None
+                continue
+
+            matched_cat_id = classified_chunk.category
+            if matched_cat_id is not None and self._strata_balancer.is_completed(matched_cat_id):
+                # the stratum reached its target, neither estimation nor metrics are needed
+                self._fragment_collection.add_ejected(read_chunk.read_id)
+                unblock_batch.append(read_chunk)
+                sessions[channel] = None
+                completed_ejections += 1
+                continue
+
+            self._command_queue.put(
+                RecordClassifiedReadCommand(read_chunk.read_id, self._reference_catalog.get_name(matched_cat_id))
+            )
+            if matched_cat_id is not None:
+                self._strata_balancer.update_estimated_received_bases(matched_cat_id)
+                if self._strata_balancer.thin_out_p(matched_cat_id):
+                    self._fragment_collection.add_ejected(read_chunk.read_id)
+                    unblock_batch.append(read_chunk)
+                else:
+                    stop_receiving_batch.append(read_chunk)
+                sessions[channel] = None
+            else:
+                fragments_count[channel] += 1
+                if fragments_count[channel] >= self._depletion_chunks:
+                    stop_receiving_batch.append(read_chunk)
+                    sessions[channel] = None
+
+        if completed_ejections > 0:
+            self._command_queue.put(RecordEventCommand("completed_stratum_eject", completed_ejections))
+
+        self._read_until_client.unblock_read_batch(unblock_batch)
+        self._read_until_client.stop_receiving_batch(stop_receiving_batch)
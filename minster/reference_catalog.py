@@ -0,0 +1,204 @@
+import hashlib
+import math
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+import pyfastx
+
+from minster.config import ReferencePanel, ReferenceSequence
+
+_HASHED_BLOCK_SIZE: int = 1 << 20
+
+
+class ReferenceFile(NamedTuple):
+    path: Path
+    content_hash: str
+    fasta_index: Path
+    minimap2_index: Optional[Path]
+
+
+class ReferenceEntry(NamedTuple):
+    strata_id: int
+    name: str
+    file_number: int
+    expected_ratio: int
+    length: int
+    contig_names: tuple[str, ...]
+    target_bases: Optional[int]
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as reference_file:
+        while block := reference_file.read(_HASHED_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_strata_table(strata_table: Path) -> tuple[dict[str, str], dict[str, int]]:
+    """
+    The stratum of every contig and the expected ratio of every stratum, in the order of
+    their first appearance in the table.
+    """
+    contig_strata: dict[str, str] = dict()
+    expected_ratios: dict[str, int] = dict()
+    with open(strata_table, "rt") as table_file:
+        for line_number, line in enumerate(table_file, start=1):
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+
+            fields = line.split("\t")
+            if len(fields) not in (2, 3):
+                raise ValueError(f"{strata_table}:{line_number} does not have 2 or 3 columns.")
+            contig_name, stratum = fields[0], fields[1]
+            expected_ratio = int(fields[2]) if len(fields) == 3 else expected_ratios.get(stratum, 1)
+            if expected_ratio < 1:
+                raise ValueError(f"{strata_table}:{line_number} has a non-positive expected ratio.")
+            if expected_ratios.get(stratum, expected_ratio) != expected_ratio:
+                raise ValueError(f"{strata_table}:{line_number} gives {stratum} a different expected ratio.")
+            if contig_name in contig_strata:
+                raise ValueError(f"{strata_table}:{line_number} assigns {contig_name} more than once.")
+
+            contig_strata[contig_name] = stratum
+            expected_ratios[stratum] = expected_ratio
+    return contig_strata, expected_ratios
+
+
+class ReferenceCatalog:
+    """
+    Scans every reference once at startup and assigns every stratum a dense integer id.
+    A stratum is either an entire reference file or, with a reference panel, the contigs
+    of a single combined FASTA that the strata table assigns to it. The ids are used on
+    all hot paths, the names only for output.
+    """
+    def __init__(
+            self,
+            reference_sequences: list[ReferenceSequence],
+            reference_panel: Optional[ReferencePanel] = None
+    ):
+        self._files: list[ReferenceFile] = []
+        self._entries: list[ReferenceEntry] = []
+        self._strata_ids: dict[str, int] = dict()
+        # contig name -> stratum id, for every file
+        self._contig_strata: list[dict[str, int]] = []
+
+        if reference_panel is not None:
+            self._add_panel(reference_panel)
+        for reference_sequence in reference_sequences:
+            self._add_file(reference_sequence)
+
+    def _scan_file(self, path: Path) -> pyfastx.Fasta:
+        # builds the pyfastx index next to the file if there is none yet
+        fasta = pyfastx.Fasta(str(path))
+        minimap2_index = path.with_name(path.name + ".mmi")
+        self._files.append(ReferenceFile(
+            path,
+            _hash_file(path),
+            path.with_name(path.name + ".fxi"),
+            minimap2_index if minimap2_index.exists() else None
+        ))
+        self._contig_strata.append(dict())
+        return fasta
+
+    def _add_entry(
+            self,
+            name: str,
+            expected_ratio: int,
+            length: int,
+            contig_names: tuple[str, ...],
+            target_bases: Optional[int] = None
+    ) -> None:
+        if name in self._strata_ids:
+            raise ValueError(f"{name} is listed more than once.")
+
+        strata_id = len(self._entries)
+        self._entries.append(ReferenceEntry(
+            strata_id,
+            name,
+            len(self._files) - 1,
+            expected_ratio,
+            length,
+            contig_names,
+            target_bases
+        ))
+        self._strata_ids[name] = strata_id
+        for contig_name in contig_names:
+            self._contig_strata[-1][contig_name] = strata_id
+
+    def _add_file(self, reference_sequence: ReferenceSequence) -> None:
+        fasta = self._scan_file(reference_sequence.path)
+        target_bases = reference_sequence.target_bases
+        if reference_sequence.target_coverage is not None:
+            target_bases = math.ceil(reference_sequence.target_coverage * fasta.size)
+        self._add_entry(
+            str(reference_sequence.path),
+            reference_sequence.expected_ratio,
+            fasta.size,
+            tuple(fasta.keys()),
+            target_bases
+        )
+
+    def _add_panel(self, reference_panel: ReferencePanel) -> None:
+        contig_strata, expected_ratios = _read_strata_table(reference_panel.strata_table)
+        fasta = self._scan_file(reference_panel.path)
+
+        contig_names: dict[str, list[str]] = {stratum: [] for stratum in expected_ratios}
+        lengths: dict[str, int] = {stratum: 0 for stratum in expected_ratios}
+        for contig_name in fasta.keys():
+            stratum = contig_strata.get(contig_name)
+            # contigs left out of the table do not belong to any stratum
+            if stratum is None:
+                continue
+            contig_names[stratum].append(contig_name)
+            lengths[stratum] += len(fasta[contig_name])
+
+        for stratum, expected_ratio in expected_ratios.items():
+            if len(contig_names[stratum]) == 0:
+                raise ValueError(f"None of the contigs of {stratum} is in {reference_panel.path}.")
+            self._add_entry(stratum, expected_ratio, lengths[stratum], tuple(contig_names[stratum]))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[ReferenceEntry]:
+        return iter(self._entries)
+
+    @property
+    def strata_ids(self) -> range:
+        return range(len(self._entries))
+
+    @property
+    def files(self) -> list[ReferenceFile]:
+        return self._files
+
+    def get_entry(self, strata_id: int) -> ReferenceEntry:
+        return self._entries[strata_id]
+
+    def get_name(self, strata_id: Optional[int]) -> Optional[str]:
+        return None if strata_id is None else self._entries[strata_id].name
+
+    def get_strata_id(self, name: str) -> int:
+        return self._strata_ids[name]
+
+    def get_length(self, strata_id: int) -> int:
+        return self._entries[strata_id].length
+
+    def get_file_strata(self, file_number: int) -> list[int]:
+        return sorted(set(self._contig_strata[file_number].values()))
+
+    def resolve_contig(self, file_number: int, contig_name: str) -> Optional[int]:
+        """
+        The stratum a contig of a reference file belongs to, None if it belongs to none.
+        """
+        return self._contig_strata[file_number].get(contig_name)
+
+    def iter_contigs(self) -> Iterator[tuple[int, str]]:
+        """
+        The stratum and the sequence of every contig that belongs to a stratum.
+        """
+        for file_number, reference_file in enumerate(self._files):
+            for contig in pyfastx.Fasta(str(reference_file.path)):
+                strata_id = self.resolve_contig(file_number, contig.name)
+                if strata_id is not None:
+                    yield strata_id, contig.seq
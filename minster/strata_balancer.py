@@ -1,26 +1,26 @@
 import random
 from dataclasses import dataclass, field
+from pathlib import Path
 from queue import Queue
 from typing import Iterable, Optional
 
 import mappy as mp
+import numpy as np
 
 from metrics.command_processor import MetricCommand, RecordBasecalledReadCommand, PrintMessageCommand
+from metrics.metrics_store import MetricsStore
 from minster.alignment_stats import AlignmentStats
-from minster.config import ReferenceSequence
+from minster.classifiers.classifier import Classifier
+from minster.config import StratumAssignmentSettings, WarmStartSettings
 from minster.estimator_manager import EstimatorManager
 from minster.nanopore_read import NanoporeRead
+from minster.reference_catalog import ReferenceCatalog
 
 
 @dataclass
 class StrataRecord:
-    _aligner: mp.Aligner
     _alignment_stats: AlignmentStats
 
-    @property
-    def aligner(self) -> mp.Aligner:
-        return self._aligner
-
     @property
     def alignment_stats(self) -> AlignmentStats:
         return self._alignment_stats
@@ -32,132 +32,347 @@ class StrataManager:
     metrics are necessary to determine whether the system is ready to start ejecting
     reads.
     """
-    _records: dict[str, StrataRecord] = field(default_factory=dict)
+    _records: dict[int, StrataRecord] = field(default_factory=dict)
 
     def insert_record(
             self,
-            strata_id: str,
-            aligner: mp.Aligner
+            strata_id: int,
+            reference_length: int
     ) -> None:
-        self._records[strata_id] = StrataRecord(aligner, AlignmentStats(strata_id))
+        self._records[strata_id] = StrataRecord(AlignmentStats(reference_length))
 
     def get_total_aligned_length(self):
         return sum(record.alignment_stats.get_aligned_length() for record in self._records.values())
 
-    def get_aligner(self, strata_id: str) -> mp.Aligner:
-        return self._records[strata_id].aligner
-
-    def update_aligned_length(self, strata_id: str, nanopore_read: NanoporeRead) -> None:
+    def update_aligned_length(self, strata_id: int, nanopore_read: NanoporeRead) -> None:
         self._records[strata_id].alignment_stats.update_aligned_length(nanopore_read)
 
-    def get_aligned_length(self, strata_id: str) -> int:
+    def get_aligned_length(self, strata_id: int) -> int:
         return self._records[strata_id].alignment_stats.get_aligned_length()
 
-    def get_aligned_read_count(self, strata_id: str) -> int:
+    def get_aligned_read_count(self, strata_id: int) -> int:
         return self._records[strata_id].alignment_stats.get_read_count()
 
-    def get_all_strata(self) -> Iterable[str]:
+    def get_all_strata(self) -> Iterable[int]:
         return self._records.keys()
 
+    def export_state(self) -> dict[str, np.ndarray]:
+        strata_ids = sorted(self._records.keys())
+        return {
+            "aligned_lengths": np.array([self.get_aligned_length(i) for i in strata_ids], dtype=np.int64),
+            "aligned_read_counts": np.array([self.get_aligned_read_count(i) for i in strata_ids], dtype=np.int64)
+        }
+
+    def restore_state(self, state: dict[str, np.ndarray]) -> None:
+        for strata_id, aligned_length, read_count in zip(
+                sorted(self._records.keys()),
+                state["aligned_lengths"].tolist(),
+                state["aligned_read_counts"].tolist()
+        ):
+            self._records[strata_id].alignment_stats.restore(aligned_length, read_count)
+
 class StrataBalancer:
     """
     Determines whether a read originating from a genome should be ejected or retained.
+    With a window length set, basecalled reads are assigned to a stratum by mapping
+    sampled windows of them and only ambiguous reads are mapped in full. With a first-pass
+    classifier, mappy only assigns the reads that the classifier cannot.
     """
     def __init__(
             self,
-            reference_sequences: list[ReferenceSequence],
-            aligners: dict[str, mp.Aligner],
+            reference_catalog: ReferenceCatalog,
+            aligners: list[mp.Aligner],
             minimum_mapped_bases: int,
             minimum_reads_for_parameter_estimation: int,
             minimum_fragments_for_ratio_estimation: int,
             thinning_accelerator: int,
-            command_queue: Queue[Optional[MetricCommand]]
+            assignment_settings: StratumAssignmentSettings,
+            command_queue: Queue[Optional[MetricCommand]],
+            first_pass_classifier: Optional[Classifier] = None
     ):
+        self._reference_catalog: ReferenceCatalog = reference_catalog
         self._strata_manager: StrataManager = StrataManager()
-        for rs in reference_sequences:
+        for entry in reference_catalog:
             self._strata_manager.insert_record(
-                str(rs.path),
-                aligners[str(rs.path)]
+                entry.strata_id,
+                entry.length
             )
+        # one aligner per reference file, hits are resolved to strata by their contig
+        self._aligners: list[mp.Aligner] = aligners
         self._estimator_manager: EstimatorManager = EstimatorManager(
-            reference_sequences,
+            reference_catalog,
             minimum_fragments_for_ratio_estimation,
             thinning_accelerator,
             command_queue
         )
         self._minimum_mapped_bases: int = minimum_mapped_bases
         self._minimum_reads_for_parameter_estimation: int = minimum_reads_for_parameter_estimation
-        self._all_warmed_up: bool = False
+        # warm-up only ever finishes, the flags are set once by the read processor
+        self._warmed_up: list[bool] = [False] * len(reference_catalog)
+        # warmed up strata whose ratio estimation is warmed up as well, thinning is balanced among these
+        self._thinning_mask: np.ndarray = np.zeros(len(reference_catalog), dtype=bool)
+        # strata that reached their target, their reads are always ejected
+        self._completed: np.ndarray = np.zeros(len(reference_catalog), dtype=bool)
         self._thr_buf: mp.ThreadBuffer = mp.ThreadBuffer()
+        self._assignment_settings: StratumAssignmentSettings = assignment_settings
+        self._first_pass_classifier: Optional[Classifier] = first_pass_classifier
         self._command_queue: Queue[Optional[MetricCommand]] = command_queue
 
-    def get_all_strata(self) -> Iterable[str]:
+    def get_all_strata(self) -> Iterable[int]:
         return self._strata_manager.get_all_strata()
 
-    def is_warmed_up(self, strata_id: str) -> bool:
-        # Decided to not keep the alignment state frozen during this entire method
-        return (
+    def is_warmed_up(self, strata_id: int) -> bool:
+        return self._warmed_up[strata_id]
+
+    def _update_warm_up(self, strata_id: int) -> None:
+        if self._warmed_up[strata_id]:
+            return
+
+        # the read count includes the weighted reads of a warm start
+        if (
                 self._strata_manager.get_aligned_length(strata_id) >= self._minimum_mapped_bases and
-                self._strata_manager.get_aligned_read_count(strata_id) >= self._minimum_reads_for_parameter_estimation
+                self._estimator_manager.get_read_counts()[strata_id] >= self._minimum_reads_for_parameter_estimation
+        ):
+            self._warmed_up[strata_id] = True
+            # its reads are classified, and so counted as received, from now on
+            self._estimator_manager.start_exposure(strata_id)
+            self._command_queue.put(
+                PrintMessageCommand(f"Warm up stage of {self._reference_catalog.get_name(strata_id)} finished.")
+            )
+
+    def _prior_strata(self, prior_names: Iterable[str]) -> dict[str, int]:
+        """
+        Maps the strata of an earlier run to the strata of this one. The strata of a
+        reference panel keep their names; the ones of reference files are named by their
+        path and matched by the file name, so that the files may move between runs. File
+        names shared by several strata of this run are ambiguous and never matched.
+        """
+        by_file_name: dict[str, Optional[int]] = {}
+        for strata_id in self._reference_catalog.strata_ids:
+            file_name = Path(self._reference_catalog.get_name(strata_id)).name
+            by_file_name[file_name] = None if file_name in by_file_name else strata_id
+
+        matched: dict[str, int] = {}
+        for name in prior_names:
+            try:
+                matched[name] = self._reference_catalog.get_strata_id(name)
+            except KeyError:
+                strata_id = by_file_name.get(Path(name).name)
+                if strata_id is not None:
+                    matched[name] = strata_id
+        return matched
+
+    def warm_start(self, warm_start_settings: WarmStartSettings) -> None:
+        """
+        Seeds the estimators from the metrics store of an earlier run, its strata are
+        matched by name or file name and the ones this run does not have are ignored.
+        """
+        prior_store = MetricsStore(str(warm_start_settings.metrics_store), read_only=True)
+        try:
+            prior_lengths = prior_store.get_basecalled_lengths()
+            classified = prior_store.get_classified_counts()
+        finally:
+            prior_store.close()
+
+        prior_strata = self._prior_strata({name for name, _ in prior_lengths} | {name for name, _ in classified})
+        basecalled = [(prior_strata[name], length) for name, length in prior_lengths if name in prior_strata]
+        if len(basecalled) == 0:
+            raise ValueError(f"None of the reads in {warm_start_settings.metrics_store} belongs to a stratum of this run.")
+
+        strata_ids = np.array([strata_id for strata_id, _ in basecalled], dtype=np.int64)
+        read_lengths = np.array([length for _, length in basecalled], dtype=np.int64)
+        reads_received: Optional[np.ndarray] = None
+        if warm_start_settings.ratio_estimates:
+            reads_received = np.zeros(len(self._reference_catalog), dtype=np.int64)
+            for name, count in classified:
+                if name in prior_strata:
+                    reads_received[prior_strata[name]] += count
+
+        self._estimator_manager.add_prior(strata_ids, read_lengths, warm_start_settings.prior_weight, reads_received)
+        self._command_queue.put(
+            PrintMessageCommand(f"Estimators seeded with {len(basecalled)} reads of {warm_start_settings.metrics_store}.")
         )
 
-    def are_all_warmed_up(self) -> bool:
-        # Decided to not keep the alignment state frozen during this entire method
-        if self._all_warmed_up:
-            return True
+    def export_state(self) -> dict[str, np.ndarray]:
+        """
+        The alignment, warm-up and estimator state of all strata, indexed by the stratum id.
+        """
+        return {
+            **self._strata_manager.export_state(),
+            **self._estimator_manager.export_state(),
+            "warmed_up": np.array(self._warmed_up, dtype=bool),
+            "thinning_mask": self._thinning_mask,
+            "completed": self._completed
+        }
+
+    def restore_state(self, state: dict[str, np.ndarray]) -> None:
+        self._strata_manager.restore_state(state)
+        self._estimator_manager.restore_state(state)
+        self._warmed_up = state["warmed_up"].astype(bool).tolist()
+        self._thinning_mask = state["thinning_mask"].astype(bool)
+        self._completed = state["completed"].astype(bool)
 
-        all_warmed_up = all(
-            self.is_warmed_up(strata_id)
-            for strata_id in self._strata_manager.get_all_strata()
+    def is_completed(self, strata_id: int) -> bool:
+        return bool(self._completed[strata_id])
+
+    def _update_completion(self, strata_id: int) -> None:
+        target_bases = self._reference_catalog.get_entry(strata_id).target_bases
+        if (
+                self._completed[strata_id] or
+                target_bases is None or
+                self._strata_manager.get_aligned_length(strata_id) < target_bases
+        ):
+            return
+
+        # both replaced rather than updated in place, a completed stratum leaves the balancing
+        # so that the remaining strata share the pore time
+        completed = self._completed.copy()
+        completed[strata_id] = True
+        self._completed = completed
+        thinning_mask = self._thinning_mask.copy()
+        thinning_mask[strata_id] = False
+        self._thinning_mask = thinning_mask
+        self._command_queue.put(
+            PrintMessageCommand(f"Target of {self._reference_catalog.get_name(strata_id)} reached, its reads are ejected.")
         )
-        if all_warmed_up:
-            self._all_warmed_up = True
-        self._command_queue.put(PrintMessageCommand(f"Warm up stage of all strata: {all_warmed_up}"))
-        return all_warmed_up
-
-    def thin_out_p(self, strata_id: str) -> bool:
-        # Decided to not keep the alignment state frozen during this entire method
-        if not self.are_all_warmed_up() or not self._estimator_manager.are_all_warmed_up():
+
+    def thin_out_p(self, strata_id: int) -> bool:
+        # the masks are replaced from two threads, a completed stratum never takes part in the balancing
+        thinning_mask = self._thinning_mask & ~self._completed
+        if not thinning_mask[strata_id]:
             return False
 
+        acceptance_rate = self._estimator_manager.get_acceptance_rate(strata_id, thinning_mask)
         self._command_queue.put(
-            PrintMessageCommand(f"Thinning a read from {strata_id} with probability {self._estimator_manager.get_acceptance_rate(strata_id)}.")
+            PrintMessageCommand(
+                f"Thinning a read from {self._reference_catalog.get_name(strata_id)} with probability {acceptance_rate}."
+            )
         )
 
         draw = random.random()
-        return draw > self._estimator_manager.get_acceptance_rate(strata_id)
+        return draw > acceptance_rate
 
-    def update_estimated_received_bases(self, category: str) -> None:
-        if not self.are_all_warmed_up():
+    def update_estimated_received_bases(self, category: int) -> None:
+        if not self.is_warmed_up(category):
             return
 
         self._estimator_manager.update_estimated_received_bases(category)
+        if (
+                not self._thinning_mask[category] and
+                not self._completed[category] and
+                self._estimator_manager.is_warmed_up(category)
+        ):
+            # replaced rather than updated in place, so that readers never see a partial update
+            thinning_mask = self._thinning_mask.copy()
+            thinning_mask[category] = True
+            self._thinning_mask = thinning_mask
+            self._command_queue.put(
+                PrintMessageCommand(f"Thinning of {self._reference_catalog.get_name(category)} enabled.")
+            )
 
-    def update_alignments(self, reads: Iterable[NanoporeRead]) -> None:
-        for read in reads:
-            best_read: Optional[NanoporeRead] = None
-            best_strata: Optional[str] = None
-            best_algn_key: Optional[tuple[int, int, int]] = None
-
-            for strata_id in self._strata_manager.get_all_strata():
-                hits = self._strata_manager.get_aligner(strata_id).map(read.get_sequence(), buf=self._thr_buf)
-                for hit in hits:
+    def _map_evidence(self, sequences: Iterable[str]) -> dict[int, tuple[int, int, int]]:
+        """
+        The best mapping quality, the total mapped length and the total edit distance of
+        the best primary hit of every sequence in every stratum. Only one hit per sequence
+        counts, the supplementary hits of a sequence would otherwise add up. For a single
+        sequence this picks the same stratum as the best hit overall.
+        """
+        evidence: dict[int, tuple[int, int, int]] = dict()
+        for sequence in sequences:
+            best_hits: dict[int, tuple[int, int, int]] = dict()
+            for file_number, aligner in enumerate(self._aligners):
+                for hit in aligner.map(sequence, buf=self._thr_buf):
                     if not hit.is_primary:
                         continue
+                    strata_id = self._reference_catalog.resolve_contig(file_number, hit.ctg)
+                    if strata_id is None:
+                        continue
+
+                    algn_key = (hit.mapq, hit.mlen, -hit.NM)
+                    if strata_id not in best_hits or algn_key > best_hits[strata_id]:
+                        best_hits[strata_id] = algn_key
+
+            for strata_id, (mapq, mlen, negative_nm) in best_hits.items():
+                best_mapq, total_mlen, total_nm = evidence.get(strata_id, (0, 0, 0))
+                evidence[strata_id] = (max(best_mapq, mapq), total_mlen + mlen, total_nm - negative_nm)
+        return evidence
+
+    def _sample_windows(self, sequence: str) -> Optional[list[str]]:
+        """
+        The windows of the sequence that are mapped first, None if the sequence is
+        too short for sampling to pay off.
+        """
+        window_length = self._assignment_settings.window_length
+        windows = self._assignment_settings.windows
+        if window_length is None or len(sequence) <= window_length * windows:
+            return None
+        if windows == 1:
+            return [sequence[:window_length]]
+
+        stride = (len(sequence) - window_length) // (windows - 1)
+        return [sequence[i * stride:i * stride + window_length] for i in range(windows)]
+
+    def _is_ambiguous(self, evidence: dict[int, tuple[int, int, int]]) -> bool:
+        if len(evidence) == 0 or max(e[0] for e in evidence.values()) < self._assignment_settings.min_mapq:
+            return True
+
+        # closely related strata map equally well and only differ in the edit distance
+        scores = sorted((mlen - nm for _, mlen, nm in evidence.values()), reverse=True)
+        return len(scores) > 1 and scores[1] >= (1 - self._assignment_settings.ambiguity_margin) * scores[0]
 
-                    algn_key = (
-                        hit.mapq,
-                        hit.mlen,
-                        -hit.NM
-                    )
-                    if best_algn_key is None or algn_key > best_algn_key:
-                        best_read = read
-                        best_algn_key = algn_key
-                        best_strata = strata_id
-
-            if best_read is not None and best_strata is not None:
-                self._strata_manager.update_aligned_length(best_strata, best_read)
-                self._estimator_manager.add_entire_read(best_strata, best_read)
-                self._command_queue.put(
-                    RecordBasecalledReadCommand(best_read.get_read_id(), best_strata, best_read.get_sequence_length())
+    def _classify_first(self, sequences: list[str]) -> Optional[int]:
+        """
+        The stratum the first-pass classifier assigns all the sequences to, None if there is
+        no classifier or it finds no stratum or different strata. The classifier only answers
+        for the strata activated in it, the rest are left to mappy.
+        """
+        if self._first_pass_classifier is None:
+            return None
+
+        calls = {self._first_pass_classifier.is_sequence_present(sequence) for sequence in sequences}
+        if len(calls) != 1:
+            return None
+        return calls.pop()
+
+    def _assign_stratum(self, read: NanoporeRead) -> Optional[int]:
+        windows = self._sample_windows(read.get_sequence())
+        classified = self._classify_first(windows if windows is not None else [read.get_sequence()])
+        if classified is not None:
+            return classified
+
+        evidence: Optional[dict[int, tuple[int, int, int]]] = None
+        if windows is not None:
+            evidence = self._map_evidence(windows)
+        if evidence is None or self._is_ambiguous(evidence):
+            evidence = self._map_evidence([read.get_sequence()])
+
+        if len(evidence) == 0:
+            return None
+        return max(evidence.items(), key=lambda item: (item[1][0], item[1][1], -item[1][2]))[0]
+
+    def update_alignments(self, reads: Iterable[NanoporeRead]) -> None:
+        strata_ids: list[int] = []
+        read_lengths: list[int] = []
+        for read in reads:
+            best_strata = self._assign_stratum(read)
+            if best_strata is None:
+                continue
+
+            self._strata_manager.update_aligned_length(best_strata, read)
+            strata_ids.append(best_strata)
+            read_lengths.append(read.get_sequence_length())
+            self._command_queue.put(
+                RecordBasecalledReadCommand(
+                    read.get_read_id(),
+                    self._reference_catalog.get_name(best_strata),
+                    read.get_sequence_length()
                 )
+            )
+
+        self._estimator_manager.add_reads(
+            np.array(strata_ids, dtype=np.int64),
+            np.array(read_lengths, dtype=np.int64)
+        )
+        for strata_id in set(strata_ids):
+            self._update_warm_up(strata_id)
+            self._update_completion(strata_id)
@@ -0,0 +1,155 @@
+"""Bookkeeping for actions sent to MinKNOW by the ReadUntilClient
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LatencyHistogram(object):
+    """A fixed-size histogram of latencies with power-of-two bucket widths
+
+    Bucket ``i`` counts latencies in ``[2**(i-1), 2**i)`` microseconds, the
+    first bucket counts everything below one microsecond and the last bucket
+    is unbounded.
+
+    :ivar counts: The number of latencies recorded in each bucket
+    :vartype counts: list
+    :ivar total: The number of recorded latencies
+    :vartype total: int
+    """
+
+    def __init__(self, buckets=32):
+        """Initialise LatencyHistogram
+
+        :param buckets: The number of buckets, defaults to 32 (~35 minutes)
+        :type buckets: int, optional
+        """
+        if buckets < 2:
+            raise ValueError("'buckets' must be >=2.")
+        self.counts = [0] * buckets
+        self.total = 0
+        self._sum_us = 0
+
+    def record(self, seconds):
+        """Add a single latency
+
+        :param seconds: The latency in seconds
+        :type seconds: float
+        """
+        micros = int(seconds * 1_000_000)
+        bucket = min(micros.bit_length(), len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.total += 1
+        self._sum_us += micros
+
+    def mean(self):
+        """The mean latency in seconds, 0.0 if nothing was recorded."""
+        if self.total == 0:
+            return 0.0
+        return self._sum_us / self.total / 1_000_000
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, in seconds
+
+        :param q: The quantile in ``[0, 1]``
+        :type q: float
+
+        :returns: The upper edge of the bucket, ``inf`` for the last bucket
+        :rtype: float
+        """
+        if self.total == 0:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                if bucket == len(self.counts) - 1:
+                    return float("inf")
+                return (1 << bucket) / 1_000_000
+        return float("inf")
+
+    def __repr__(self):
+        return "{}(n={}, mean={:.4f}s, p50<={:.4f}s, p99<={:.4f}s)".format(
+            type(self).__name__,
+            self.total,
+            self.mean(),
+            self.quantile(0.5),
+            self.quantile(0.99),
+        )
+
+
+class ActionTracker(object):
+    """A thread-safe, bounded table of in-flight actions
+
+    Actions are registered when they are put on the gRPC stream and evicted
+    when MinKNOW responds to them, at which point the send-to-response
+    latency is recorded into ``latency``. If MinKNOW never responds the
+    oldest entries are dropped once ``size`` actions are in flight, so the
+    table never grows past ``size`` entries.
+
+    :ivar size: The maximum number of in-flight actions
+    :vartype size: int
+    :ivar expired: The number of actions evicted without a response
+    :vartype expired: int
+    :ivar unknown: The number of responses to actions that were not in flight
+    :vartype unknown: int
+    :ivar latency: The send-to-response latencies of evicted actions
+    :vartype latency: LatencyHistogram
+    """
+
+    def __init__(self, size=100_000):
+        """Initialise ActionTracker
+
+        :param size: The maximum number of in-flight actions, defaults to 100000
+        :type size: int, optional
+        """
+        if size < 1:
+            raise ValueError("'size' must be >=1.")
+        self.size = size
+        self._in_flight = OrderedDict()
+        self.lock = Lock()
+        self.expired = 0
+        self.unknown = 0
+        self.latency = LatencyHistogram()
+
+    def __len__(self):
+        """Delegate with lock."""
+        with self.lock:
+            return len(self._in_flight)
+
+    def sent(self, actions, kind):
+        """Register actions that have just been put on the gRPC stream
+
+        :param actions: Action ids of the sent actions
+        :type actions: iterable of str
+        :param kind: Either 'stop_further_data' or 'unblock'
+        :type kind: str
+        """
+        now = time.monotonic()
+        with self.lock:
+            for action_id in actions:
+                self._in_flight[action_id] = (kind, now)
+
+            while len(self._in_flight) > self.size:
+                self._in_flight.popitem(last=False)
+                self.expired += 1
+
+    def respond(self, action_id):
+        """Evict an action MinKNOW responded to and record its latency
+
+        :param action_id: The action id from the response
+        :type action_id: str
+
+        :returns: The kind of the action or ``None`` if it was not in flight
+        :rtype: str
+        """
+        with self.lock:
+            entry = self._in_flight.pop(action_id, None)
+            if entry is None:
+                self.unknown += 1
+                return None
+            kind, sent_at = entry
+            self.latency.record(time.monotonic() - sent_at)
+            return kind
+
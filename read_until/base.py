@@ -8,7 +8,6 @@ import grpc
 import logging
 import queue
 import time
-import uuid
 from collections import Counter, defaultdict, namedtuple
 from itertools import count as _count
 from threading import Event, Thread
@@ -16,6 +15,7 @@ from typing import Set
 
 from minknow_api import data_pb2, Connection
 from minknow_api.data import get_numpy_types
+from read_until.action_tracker import ActionTracker
 from read_until.read_cache import ReadCache
 
 __all__ = ["ReadUntilClient"]
@@ -49,6 +49,42 @@ def _new_thread_name(template="read_until-%d"):
 # filtering functionality.
 ALLOWED_MIN_CHUNK_SIZE = 0
 DEFAULT_PREFILTER_CLASSES = {"strand", "adapter"}
+# Upper bound on the number of actions awaiting a response from MinKNOW.
+MAX_ACTIONS_IN_FLIGHT = 100_000
+
+
+class DecisionTable(object):
+    """A fixed-size table of the latest read decided on each channel
+
+    The table is indexed by channel number and holds the id of the latest
+    read a decision (stop_further_data/unblock) was made on. Its size is
+    fixed by the channel count so it does not grow over the course of a run.
+
+    :ivar read_ids: The latest decided read id per channel, ``None`` if no
+        decision was made yet
+    :vartype read_ids: list
+    """
+
+    def __init__(self, last_channel):
+        """Initialise DecisionTable
+
+        :param last_channel: The highest channel number that can be decided on
+        :type last_channel: int
+        """
+        if last_channel < 1:
+            raise ValueError("'last_channel' must be >=1.")
+        # index 0 is unused, channels are numbered from 1
+        self.read_ids = [None] * (last_channel + 1)
+
+    def update(self, reads):
+        """Record a decision for a batch of reads
+
+        :param reads: List of (channel, read_id)
+        :type reads: list(tuple)
+        """
+        read_ids = self.read_ids
+        for channel, read_id in reads:
+            read_ids[channel] = read_id
 
 
 class ReadUntilClient(object):
@@ -137,9 +173,6 @@ class ReadUntilClient(object):
         self.one_chunk = one_chunk
         self.prefilter_classes = prefilter_classes
 
-        # Stores the most recent read number that a decision has been made on (stop_receiving/unblock)
-        self.channel_read_latest_decision = defaultdict(str)
-
         try:
             self.connection = Connection(
                 host=self.mk_host, port=self.mk_grpc_port, credentials=mk_credentials
@@ -239,11 +272,15 @@ class ReadUntilClient(object):
             will attempt to unblock in samples.
         :keyword max_unblock_read_length_seconds: Maximum read length MinKNOW
             will attempt to unblock in seconds
+        :keyword action_flush_interval_us: Time in microseconds to keep
+            collecting actions after the first one is queued before they are
+            sent as a single request. ``0`` sends whatever is pending at once.
         :type first_channel: int
         :type last_channel: int
         :type min_chunk_size: int
         :type max_unblock_read_length_samples: int
         :type max_unblock_read_length_seconds: float
+        :type action_flush_interval_us: int
         """
         self._process_thread = Thread(
             target=self._run, name=_new_thread_name(), kwargs=kwargs
@@ -270,16 +307,21 @@ class ReadUntilClient(object):
         # a flag to indicate whether gRPC stream is being processed. Any
         #    running ._runner() will respond to this.
         self.running = Event()
-        # the action_queue is used to store unblock/stop_receiving_data
-        #    requests before they are put on the gRPC stream.
+        # the action_queue is used to store (kind, [actions]) pairs of
+        #    unblock/stop_receiving_data requests before they are put on
+        #    the gRPC stream.
         self.action_queue = queue.Queue()
 
-        self.channel_read_latest_decision = defaultdict(str)
+        # Stores the most recent read id that a decision has been made on
+        #    (stop_receiving/unblock) per channel
+        self.channel_read_latest_decision = DecisionTable(self.last_channel)
 
         # the data_queue is used to store the latest chunk per channel
         self.data_queue = self.CacheType(size=self.cache_size)
-        # stores all sent action ids -> unblock/stop
-        self.sent_actions = dict()
+        # stores in-flight action ids -> unblock/stop until MinKNOW responds
+        self.sent_actions = ActionTracker(size=MAX_ACTIONS_IN_FLIGHT)
+        # action ids are a monotonic counter, encoded once per action
+        self._action_ids = _count()
 
     @property
     def aquisition_progress(self):
@@ -346,10 +388,11 @@ class ReadUntilClient(object):
         data = self.data_queue.popitems(items=batch_size, last=last)
 
         if not self.one_chunk:
+            decided = self.channel_read_latest_decision.read_ids
             data = [
                 (channel, read)
                 for (channel, read) in data
-                if read.id not in self.channel_read_latest_decision[channel]
+                if read.id != decided[channel]
             ]
         return data
 
@@ -370,11 +413,14 @@ class ReadUntilClient(object):
             self._generate_action(channel, read, "unblock", duration=duration)
             for (channel, read) in reads
         ]
+        if not actions:
+            return
+
         if not self.one_chunk:
             # Decision about to be made so update cache
             self.channel_read_latest_decision.update(reads)
 
-        self.action_queue.put(actions)
+        self.action_queue.put(("unblock", actions))
 
     def unblock_read(self, read_channel, read_number, duration=0.1):
         """Request that a read be unblocked.
@@ -406,11 +452,14 @@ class ReadUntilClient(object):
             for (channel, read) in reads
         ]
 
+        if not actions:
+            return
+
         if not self.one_chunk:
             # Decision about to be made so update cache
             self.channel_read_latest_decision.update(reads)
 
-        self.action_queue.put(actions)
+        self.action_queue.put(("stop_further_data", actions))
 
     def stop_receiving_read(self, read_channel, read_number):
         """Request to receive no more data for a read.
@@ -459,9 +508,11 @@ class ReadUntilClient(object):
         max_unblock_read_length_samples=None,
         max_unblock_read_length_seconds=None,
         accepted_first_chunk_classifications=None,
+        action_flush_interval_us=0,
     ):
         """Yield the stream initializer request followed by action requests
-        placed into the action_queue.
+        placed into the action_queue. All actions pending on the action_queue
+        are coalesced into a single request.
 
         :param first_channel: lowest channel for which to receive raw data.
         :param last_channel: highest channel (inclusive) for which to receive data.
@@ -473,6 +524,8 @@ class ReadUntilClient(object):
         :param accepted_first_chunk_classifications (list of str): If specified,
             minknow will only stream reads that start with one of these
             classifications. All others will be _accepted_ + not streamed
+        :param action_flush_interval_us: time in microseconds to keep collecting
+            actions after the first one is queued before sending them.
         """
         setup = {}
         # This allows the channels to default to all available channels on the
@@ -519,18 +572,39 @@ class ReadUntilClient(object):
             setup=data_pb2.GetLiveReadsRequest.StreamSetup(**setup)
         )
 
+        if action_flush_interval_us < 0:
+            raise ValueError("'action_flush_interval_us' must be >=0.")
+        flush_interval = action_flush_interval_us / 1_000_000
+
         while self.is_running:
             try:
-                actions = self.action_queue.get(timeout=0.1)
-
-                self.logger.debug("Sending %s actions.", len(actions))
-                action_group = data_pb2.GetLiveReadsRequest(
-                    actions=data_pb2.GetLiveReadsRequest.Actions(actions=actions)
-                )
-                yield action_group
+                pending = [self.action_queue.get(timeout=0.1)]
             except queue.Empty:
                 continue
 
+            deadline = time.monotonic() + flush_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        pending.append(self.action_queue.get(timeout=remaining))
+                    else:
+                        pending.append(self.action_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            actions = []
+            for kind, group in pending:
+                self.sent_actions.sent((a.action_id for a in group), kind)
+                actions.extend(group)
+
+            self.logger.debug(
+                "Sending %s actions from %s batches.", len(actions), len(pending)
+            )
+            yield data_pb2.GetLiveReadsRequest(
+                actions=data_pb2.GetLiveReadsRequest.Actions(actions=actions)
+            )
+
     def _process_reads(self, reads):
         """Process the gRPC stream data, storing read chunks in the data_queue.
 
@@ -555,7 +629,7 @@ class ReadUntilClient(object):
             # record a count of success and fails
             if reads_chunk.action_responses:
                 for response in reads_chunk.action_responses:
-                    action_type = self.sent_actions[response.action_id]
+                    action_type = self.sent_actions.respond(response.action_id)
                     response_counter[action_type][response.response] += 1
 
             progress = self.aquisition_progress
@@ -602,6 +676,13 @@ class ReadUntilClient(object):
                     self.missed_chunks,
                 )
                 self.logger.info("Response summary: %s", response_counter)
+                self.logger.info(
+                    "Action latency: %s, %s in flight, %s expired, %s unknown.",
+                    self.sent_actions.latency,
+                    len(self.sent_actions),
+                    self.sent_actions.expired,
+                    self.sent_actions.unknown,
+                )
 
                 read_count = 0
                 samples_behind = 0
@@ -618,13 +699,11 @@ class ReadUntilClient(object):
             are: 'duration' for `action='unblock'`.
 
         """
-        action_id = str(uuid.uuid4())
         action_kwargs = {
-            "action_id": action_id,
+            "action_id": str(next(self._action_ids)),
             "channel": read_channel,
             "id": read_id,
         }
-        self.sent_actions[action_id] = action
         if action == "stop_further_data":
             action_kwargs[action] = data_pb2.GetLiveReadsRequest.StopFurtherData()
         elif action == "unblock":
@@ -636,12 +715,4 @@ class ReadUntilClient(object):
                 "'action' parameter must must be 'stop_further_data' or 'unblock'."
             )
 
-        action_request = data_pb2.GetLiveReadsRequest.Action(**action_kwargs)
-        self.logger.debug(
-            "Action %s on channel %s, read %s: %s",
-            action_id,
-            read_channel,
-            read_id,
-            action,
-        )
-        return action_request
+        return data_pb2.GetLiveReadsRequest.Action(**action_kwargs)
@@ -0,0 +1,110 @@
+import time
+import tracemalloc
+from queue import Queue
+from typing import NamedTuple
+
+import numpy as np
+
+from minster.basecall_pool import BasecallClientPool
+from minster.config import BasecallerSettings
+from minster.dorado_wrapper import DoradoWrapper
+from read_until.base import CALIBRATION
+
+# times DoradoWrapper.basecall over a basecall client that returns every read it is passed
+# on the next poll, so that the time and memory measured are spent in the wrapper and pool
+# run from the repository root: python -m simulation.packaging_benchmark
+CHANNELS = 512
+SAMPLES_PER_CHUNK = 4_000
+PASSES = 200
+SAMPLING_RATE = 5_000.0
+SIGNAL_DTYPE = np.dtype(np.int16)
+
+
+class ReadData(NamedTuple):
+    id: str
+    raw_data: bytes
+    start_sample: int
+
+
+class EchoClient:
+    """
+    Stands in for PyBasecallClient, every read is basecalled to an empty sequence at once.
+    """
+    high_priority = 2
+
+    def __init__(self, address: str, config: str):
+        self._passed: list[dict] = []
+
+    def set_params(self, params: dict) -> None:
+        pass
+
+    def connect(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def pass_reads(self, reads: list[dict]) -> bool:
+        self._passed.extend(reads)
+        return True
+
+    def get_completed_reads(self) -> list[list[dict]]:
+        results = [
+            {"sub_tag": 0, "metadata": {"read_id": read["read_id"]}, "datasets": {"sequence": ""}}
+            for read in self._passed
+        ]
+        self._passed = []
+        return [results]
+
+
+def make_passes(rng: np.random.Generator) -> list[list[tuple[int, ReadData]]]:
+    signal = rng.integers(-500, 500, size=SAMPLES_PER_CHUNK, dtype=np.int16).tobytes()
+    return [
+        [(channel, ReadData(f"read-{p}-{channel}", signal, p * SAMPLES_PER_CHUNK)) for channel in range(1, CHANNELS + 1)]
+        for p in range(PASSES)
+    ]
+
+
+def run_pass(wrapper: DoradoWrapper, reads: list[tuple[int, ReadData]]) -> None:
+    for _ in wrapper.basecall(reads, SIGNAL_DTYPE):
+        pass
+
+
+def measure(wrapper: DoradoWrapper, passes: list[list[tuple[int, ReadData]]]) -> None:
+    # one pass first, so that the reused containers exist
+    run_pass(wrapper, passes[0])
+    t0 = time.perf_counter()
+    for reads in passes[1:]:
+        run_pass(wrapper, reads)
+    elapsed = time.perf_counter() - t0
+
+    # the peak memory allocated during a pass, over what is kept between passes
+    tracemalloc.start()
+    run_pass(wrapper, passes[0])
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for reads in passes[1:11]:
+        run_pass(wrapper, reads)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{1e6 * elapsed / ((len(passes) - 1) * CHANNELS):.2f} us per read, "
+        f"{(peak - baseline) / CHANNELS:.0f} bytes allocated per read"
+    )
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    calibration_values = {
+        channel: CALIBRATION(float(rng.uniform(0.1, 0.3)), float(rng.uniform(-250, -200)))
+        for channel in range(1, CHANNELS + 1)
+    }
+    basecaller_settings = BasecallerSettings(config="benchmark")
+    wrapper = DoradoWrapper(
+        basecaller_settings,
+        SAMPLING_RATE,
+        0.0,
+        calibration_values,
+        BasecallClientPool(basecaller_settings, 0.0, Queue(), EchoClient)
+    )
+    measure(wrapper, make_passes(rng))
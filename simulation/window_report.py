@@ -0,0 +1,60 @@
+import sqlite3
+import sys
+
+import numpy as np
+
+# compares the basecaller queue time and the read until classification accuracy of runs
+# with different signal window settings, from their metrics stores
+# run from the repository root: python -m simulation.window_report full.sqlite windowed.sqlite
+
+
+def basecall_latencies(conn: sqlite3.Connection) -> tuple[np.ndarray, np.ndarray]:
+    batches = conn.execute("SELECT samples, duration FROM basecall_batches").fetchall()
+    samples = np.array([b[0] for b in batches], dtype=np.float64)
+    durations = np.array([b[1] for b in batches], dtype=np.float64)
+    return samples, durations
+
+
+def classification_agreement(conn: sqlite3.Connection) -> tuple[int, int, int]:
+    """
+    The reads decided during read until, the ones among them that were basecalled in full
+    and the ones whose read until stratum agrees with the stratum of the full read. Ejected
+    reads are never basecalled in full, so only the accepted ones are compared.
+    """
+    decided = dict(conn.execute(
+        "SELECT read_id, inferred_class FROM classified_reads WHERE inferred_class IS NOT NULL"
+    ).fetchall())
+    compared = 0
+    agreeing = 0
+    for read_id, final_class in conn.execute(
+            "SELECT read_id, final_class FROM basecalled_reads WHERE final_class IS NOT NULL"
+    ):
+        inferred_class = decided.get(read_id)
+        if inferred_class is None:
+            continue
+        compared += 1
+        agreeing += inferred_class == final_class
+    return len(decided), compared, agreeing
+
+
+def report(db_path: str) -> None:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        samples, durations = basecall_latencies(conn)
+        decided, compared, agreeing = classification_agreement(conn)
+    finally:
+        conn.close()
+
+    print(db_path)
+    if len(durations) > 0:
+        print(
+            f"  {len(durations)} basecall batches, {np.mean(samples):.0f} samples on average, "
+            f"queue time p50 {np.percentile(durations, 50):.3f}s, p95 {np.percentile(durations, 95):.3f}s"
+        )
+    if compared > 0:
+        print(f"  {decided} reads decided, {agreeing / compared:.2%} of the {compared} accepted ones agree with the full read")
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        report(path)
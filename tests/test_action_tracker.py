@@ -0,0 +1,83 @@
+import pytest
+
+from read_until.action_tracker import ActionTracker, LatencyHistogram
+
+
+def test_histogram_buckets_by_power_of_two():
+    histogram = LatencyHistogram(buckets=4)
+    histogram.record(0.0000005)
+    histogram.record(0.000001)
+    histogram.record(0.000003)
+    histogram.record(1.0)
+
+    assert histogram.counts == [1, 1, 1, 1]
+    assert histogram.total == 4
+
+
+def test_histogram_quantiles_are_bucket_upper_bounds():
+    histogram = LatencyHistogram()
+    for _ in range(99):
+        histogram.record(0.000100)
+    histogram.record(0.010)
+
+    assert histogram.quantile(0.5) == 128 / 1_000_000
+    assert histogram.quantile(1.0) == 16_384 / 1_000_000
+    assert histogram.mean() == pytest.approx((99 * 0.000100 + 0.010) / 100)
+
+
+def test_histogram_last_bucket_is_unbounded():
+    histogram = LatencyHistogram(buckets=2)
+    histogram.record(10.0)
+
+    assert histogram.counts == [0, 1]
+    assert histogram.quantile(0.5) == float("inf")
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+
+    assert histogram.mean() == 0.0
+    assert histogram.quantile(0.99) == 0.0
+
+
+def test_histogram_needs_two_buckets():
+    with pytest.raises(ValueError):
+        LatencyHistogram(buckets=1)
+
+
+def test_tracker_evicts_responded_actions():
+    tracker = ActionTracker(size=10)
+    tracker.sent(["a", "b"], "unblock")
+
+    assert len(tracker) == 2
+    assert tracker.respond("a") == "unblock"
+    assert len(tracker) == 1
+    assert tracker.latency.total == 1
+
+
+def test_tracker_counts_unknown_responses():
+    tracker = ActionTracker(size=10)
+    tracker.sent(["a"], "stop_further_data")
+
+    assert tracker.respond("b") is None
+    assert tracker.respond("a") == "stop_further_data"
+    assert tracker.respond("a") is None
+    assert tracker.unknown == 2
+    assert tracker.latency.total == 1
+
+
+def test_tracker_drops_oldest_actions_past_its_size():
+    tracker = ActionTracker(size=2)
+    tracker.sent(["a", "b"], "unblock")
+    tracker.sent(["c"], "stop_further_data")
+
+    assert len(tracker) == 2
+    assert tracker.expired == 1
+    assert tracker.respond("a") is None
+    assert tracker.respond("b") == "unblock"
+    assert tracker.respond("c") == "stop_further_data"
+
+
+def test_tracker_needs_a_positive_size():
+    with pytest.raises(ValueError):
+        ActionTracker(size=0)
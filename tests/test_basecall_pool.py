@@ -0,0 +1,144 @@
+from queue import Queue
+
+import pytest
+
+pytest.importorskip("pybasecall_client_lib")
+
+from metrics.command_processor import RecordBasecallBatchCommand
+from minster.basecall_pool import BasecallClientPool, BasecallEndpoint
+from minster.config import BasecallerSettings
+
+
+class FakeClient:
+    """
+    Basecalls every read it accepts by the next poll, unless it is told to refuse reads.
+    """
+    high_priority = 2
+    created: list["FakeClient"] = []
+    unreachable: set[str] = set()
+
+    def __init__(self, address: str, config: str):
+        self.address = address
+        self.accepting = True
+        self.connected = False
+        self.passed: list[dict] = []
+        FakeClient.created.append(self)
+
+    def set_params(self, params: dict) -> None:
+        pass
+
+    def connect(self) -> None:
+        if self.address in FakeClient.unreachable:
+            raise ConnectionError(self.address)
+        self.connected = True
+
+    def disconnect(self) -> None:
+        self.connected = False
+
+    def pass_reads(self, reads: list[dict]) -> bool:
+        if not self.accepting:
+            return False
+        self.passed.extend(reads)
+        return True
+
+    def get_completed_reads(self) -> list[list[dict]]:
+        results = [{"sub_tag": 0, "metadata": {"read_id": read["read_id"]}} for read in self.passed]
+        self.passed = []
+        return [results]
+
+
+@pytest.fixture(autouse=True)
+def fake_clients():
+    FakeClient.created = []
+    FakeClient.unreachable = set()
+
+
+def submission(*read_ids: str) -> list[dict]:
+    return [{"read_id": read_id} for read_id in read_ids]
+
+
+def make_pool(command_queue: Queue) -> BasecallClientPool:
+    return BasecallClientPool(
+        BasecallerSettings(config="fake", address="ipc:///tmp/a", additional_addresses=["ipc:///tmp/b"], max_attempts=2),
+        0.0,
+        command_queue,
+        FakeClient
+    )
+
+
+def test_submissions_go_to_the_endpoint_with_the_least_outstanding_signal():
+    pool = make_pool(Queue())
+    first, second = FakeClient.created
+
+    assert pool.submit(submission("r1"), 100)
+    assert pool.submit(submission("r2"), 50)
+    assert pool.submit(submission("r3"), 10)
+
+    assert [read["read_id"] for read in first.passed] == ["r1"]
+    assert [read["read_id"] for read in second.passed] == ["r2", "r3"]
+    assert pool.get_outstanding_reads() == 3
+
+
+def test_completed_reads_finish_the_pass():
+    command_queue: Queue = Queue()
+    pool = make_pool(command_queue)
+    pool.submit(submission("r1", "r2"), 100)
+
+    assert sorted(result["metadata"]["read_id"] for result in pool.get_completed_reads()) == ["r1", "r2"]
+    assert pool.get_outstanding_reads() == 0
+    command = command_queue.get_nowait()
+    assert isinstance(command, RecordBasecallBatchCommand)
+    assert command_queue.empty()
+
+
+def test_a_refusing_endpoint_is_reconnected_and_its_reads_are_lost():
+    command_queue: Queue = Queue()
+    pool = make_pool(command_queue)
+    first, second = FakeClient.created
+    pool.submit(submission("r1"), 10)
+    pool.submit(submission("r2"), 50)
+    first.accepting = False
+
+    # the first endpoint has the least outstanding signal, the submission falls through to the second
+    assert pool.submit(submission("r3"), 100)
+    assert [read["read_id"] for read in second.passed] == ["r2", "r3"]
+    assert pool.take_lost_reads() == 1
+    assert pool.take_lost_reads() == 0
+
+    reconnected = FakeClient.created[-1]
+    assert not first.connected and reconnected.connected and reconnected.address == first.address
+    # the pass of the lost read is never recorded
+    pool.get_completed_reads()
+    assert command_queue.qsize() == 1
+
+
+def test_abandoned_reads_are_lost():
+    pool = make_pool(Queue())
+    pool.submit(submission("r1", "r2"), 10)
+    pool.abandon_outstanding()
+
+    assert pool.take_lost_reads() == 2
+    assert pool.get_outstanding_reads() == 0
+    assert pool.get_completed_reads() == []
+
+
+def test_reconnect_drops_the_pass():
+    endpoint = BasecallEndpoint("ipc:///tmp/a", "fake", FakeClient)
+    endpoint.pass_reads(submission("r1", "r2"), 100)
+
+    assert endpoint.reconnect() == 2
+    assert endpoint.outstanding_reads == 0
+    assert endpoint.outstanding_samples == 0
+    assert endpoint.finish_pass() is None
+
+
+def test_unreachable_endpoints_connect_on_their_next_submission():
+    FakeClient.unreachable.add("ipc:///tmp/a")
+    endpoint = BasecallEndpoint("ipc:///tmp/a", "fake", FakeClient)
+
+    assert endpoint.get_completed_reads() == []
+    assert not endpoint.pass_reads(submission("r1"), 10)
+
+    FakeClient.unreachable.clear()
+    assert endpoint.pass_reads(submission("r1"), 10)
+    assert endpoint.outstanding_reads == 1
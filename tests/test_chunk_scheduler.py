@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pybasecall_client_lib")
+
+from minknow_api.data_pb2 import GetLiveReadsResponse
+
+from minster.chunk_scheduler import ChunkScheduler, LoadShedder
+from minster.dorado_wrapper import ReadChunk
+
+SIGNAL_DTYPE = np.dtype(np.int16)
+
+
+def read_data(read_id: str, samples: int) -> GetLiveReadsResponse.ReadData:
+    return GetLiveReadsResponse.ReadData(
+        id=read_id,
+        start_sample=0,
+        chunk_start_sample=0,
+        raw_data=np.zeros(samples, dtype=SIGNAL_DTYPE).tobytes()
+    )
+
+
+def test_oldest_reads_are_basecalled_first():
+    scheduler = ChunkScheduler(5_000.0, None)
+    scheduled = scheduler.schedule(
+        [(1, read_data("a", 1_000)), (2, read_data("b", 3_000)), (3, read_data("c", 2_000))],
+        SIGNAL_DTYPE,
+        2
+    )
+
+    assert [channel for channel, _ in scheduled.to_basecall] == [2, 3]
+    assert scheduled.expired == []
+
+
+def test_reads_wait_for_the_next_batch():
+    scheduler = ChunkScheduler(5_000.0, None)
+    scheduler.schedule([(1, read_data("a", 1_000)), (2, read_data("b", 3_000))], SIGNAL_DTYPE, 1)
+
+    # the waiting chunk is replaced by the newer chunk of the same read
+    scheduled = scheduler.schedule([(1, read_data("a", 4_000))], SIGNAL_DTYPE, 1)
+    assert [(channel, read.id) for channel, read in scheduled.to_basecall] == [(1, "a")]
+    assert len(scheduled.to_basecall[0][1].raw_data) == 8_000
+
+
+def test_reads_past_the_deadline_expire():
+    scheduler = ChunkScheduler(5_000.0, 0.5)
+    scheduled = scheduler.schedule(
+        [(1, read_data("a", 1_000)), (2, read_data("b", 2_500))],
+        SIGNAL_DTYPE,
+        2
+    )
+
+    assert [channel for channel, _ in scheduled.to_basecall] == [1]
+    assert scheduled.expired == [ReadChunk(2, "b")]
+
+
+def test_excess_reads_are_shed_low_priority_channels_first():
+    scheduler = ChunkScheduler(5_000.0, None, low_priority_channels=[2])
+    scheduled = scheduler.schedule(
+        [(1, read_data("a", 1_000)), (2, read_data("b", 3_000)), (3, read_data("c", 2_000))],
+        SIGNAL_DTYPE,
+        2,
+        shed_excess=True
+    )
+
+    assert [channel for channel, _ in scheduled.to_basecall] == [3, 1]
+    assert scheduled.shed == [ReadChunk(2, "b")]
+    # the backlog is measured before the excess was shed
+    assert scheduler.get_backlog() == 1
+    assert scheduler.schedule([], SIGNAL_DTYPE, 2).to_basecall == []
+
+
+def test_backlog_counts_the_reads_left_waiting():
+    scheduler = ChunkScheduler(5_000.0, None)
+    scheduler.schedule([(channel, read_data(str(channel), 1_000)) for channel in range(1, 6)], SIGNAL_DTYPE, 2)
+
+    assert scheduler.get_backlog() == 3
+
+
+def test_shedder_halves_the_batch_while_overloaded():
+    shedder = LoadShedder(16, 0.5, None)
+
+    assert shedder.observe(1.0, 0)
+    assert shedder.overloaded
+    assert shedder.batch_size == 8
+    assert shedder.observe(1.0, 0)
+    assert shedder.batch_size == 4
+
+
+def test_shedder_grows_the_batch_back_by_one():
+    shedder = LoadShedder(4, 0.5, None, smoothing=1.0)
+    shedder.observe(1.0, 0)
+    shedder.observe(1.0, 0)
+    assert shedder.batch_size == 1
+
+    assert not shedder.observe(0.1, 0)
+    assert not shedder.overloaded
+    assert shedder.batch_size == 2
+    for _ in range(5):
+        shedder.observe(0.1, 0)
+    assert shedder.batch_size == 4
+
+
+def test_shedder_smooths_the_round_trip():
+    shedder = LoadShedder(4, 0.5, None, smoothing=0.2)
+    shedder.observe(0.1, 0)
+    shedder.observe(2.0, 0)
+
+    assert shedder.round_trip == pytest.approx(0.2 * 2.0 + 0.8 * 0.1)
+    # a single slow pass does not push the average over the budget
+    assert not shedder.overloaded
+    # passes without a completed batch keep the average
+    shedder.observe(None, 0)
+    assert shedder.round_trip == pytest.approx(0.48)
+
+
+def test_shedder_watches_the_backlog():
+    shedder = LoadShedder(8, None, 100)
+
+    assert not shedder.observe(None, 100)
+    assert shedder.observe(None, 101)
+    assert shedder.batch_size == 4
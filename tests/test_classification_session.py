@@ -0,0 +1,58 @@
+from minster.classifiers.classifier import ClassificationSession
+
+
+def test_increments_overlap_the_previous_pass():
+    session = ClassificationSession("read")
+    session.add_evidence(0, 60, 100, 1)
+
+    assert session.take_increment("A" * 100, 10) == "A" * 100
+    assert session.take_increment("A" * 100 + "C" * 50, 10) == "A" * 10 + "C" * 50
+    assert session.scored_length == 150
+
+
+def test_undecided_reads_rescore_up_to_the_new_bases():
+    session = ClassificationSession("read")
+
+    assert len(session.take_increment("A" * 2_000, 10, undecided_length=1_000)) == 2_000
+    # 100 new bases, scored together with the 100 bases before them
+    assert len(session.take_increment("A" * 2_100, 10, undecided_length=1_000)) == 200
+    # never more than the undecided length before the new bases
+    assert len(session.take_increment("A" * 5_100, 10, undecided_length=1_000)) == 4_000
+    # the overlap alone, once there is evidence
+    session.add_evidence(1, 60, 100, 0)
+    assert len(session.take_increment("A" * 5_200, 10, undecided_length=1_000)) == 110
+
+
+def test_windowed_sequences_are_scored_as_a_whole():
+    session = ClassificationSession("read")
+    session.add_evidence(0, 60, 100, 0)
+    session.take_increment("A" * 300, 10)
+    session.mark_windowed()
+
+    assert session.take_increment("C" * 80, 10) == "C" * 80
+    assert session.scored_length == 380
+
+
+def test_evidence_adds_up_across_passes():
+    session = ClassificationSession("read")
+    session.add_evidence(3, 20, 60, 5)
+    assert session.decided_container(100) is None
+
+    session.add_evidence(3, 10, 60, 2)
+    assert session.get_evidence_length(3) == 120
+    assert session.decided_container(100) == 3
+
+
+def test_best_container_prefers_quality_then_length():
+    session = ClassificationSession("read")
+    assert session.best_container() is None
+
+    session.add_evidence(0, 30, 500, 0)
+    session.add_evidence(1, 40, 100, 0)
+    assert session.best_container() == 1
+
+    session.add_evidence(0, 40, 0, 0)
+    assert session.best_container() == 0
+    # the best container alone decides, the runner-up's evidence is not enough
+    session.add_evidence(2, 60, 50, 0)
+    assert session.decided_container(100) is None
@@ -0,0 +1,104 @@
+from queue import Queue
+from typing import NamedTuple
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pybasecall_client_lib")
+
+from minster.basecall_pool import BasecallClientPool
+from minster.config import BasecallerSettings
+from minster.dorado_wrapper import DoradoWrapper
+from read_until.base import CALIBRATION
+
+SIGNAL_DTYPE = np.dtype(np.int16)
+
+
+class ReadData(NamedTuple):
+    id: str
+    raw_data: bytes
+    start_sample: int
+
+
+class RecordingClient:
+    """
+    Keeps a copy of every request passed to it and basecalls it on the next poll.
+    """
+    high_priority = 2
+    requests: list[dict] = []
+
+    def __init__(self, address: str, config: str):
+        self._passed: list[dict] = []
+
+    def set_params(self, params: dict) -> None:
+        pass
+
+    def connect(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def pass_reads(self, reads: list[dict]) -> bool:
+        RecordingClient.requests.extend(dict(read) for read in reads)
+        self._passed.extend(reads)
+        return True
+
+    def get_completed_reads(self) -> list[list[dict]]:
+        results = [
+            {"sub_tag": 0, "metadata": {"read_id": read["read_id"]}, "datasets": {"sequence": "ACGT"}}
+            for read in self._passed
+        ]
+        self._passed = []
+        return [results]
+
+
+@pytest.fixture
+def wrapper() -> DoradoWrapper:
+    RecordingClient.requests = []
+    settings = BasecallerSettings(config="fake", tail_window_overlap=100)
+    return DoradoWrapper(
+        settings,
+        5_000.0,
+        0.0,
+        {1: CALIBRATION(0.5, -200.0), 2: CALIBRATION(0.25, -100.0)},
+        BasecallClientPool(settings, 0.0, Queue(), RecordingClient)
+    )
+
+
+def signal(samples: int) -> bytes:
+    return np.arange(samples, dtype=SIGNAL_DTYPE).tobytes()
+
+
+def basecall(wrapper: DoradoWrapper, reads: list[tuple[int, ReadData]]) -> list[tuple[int, str, bool]]:
+    return [
+        (chunk.read_chunk.channel, chunk.read_chunk.read_id, chunk.windowed)
+        for chunks in wrapper.basecall(reads, SIGNAL_DTYPE)
+        for chunk in chunks
+    ]
+
+
+def test_requests_carry_the_calibration_of_their_channel(wrapper):
+    assert sorted(basecall(wrapper, [(1, ReadData("a", signal(1_000), 0)), (2, ReadData("b", signal(500), 0))])) == [
+        (1, "a", False),
+        (2, "b", False)
+    ]
+
+    by_read = {request["read_id"]: request for request in RecordingClient.requests}
+    assert (by_read["a"]["daq_scaling"], by_read["a"]["daq_offset"]) == (0.5, -200.0)
+    assert (by_read["b"]["daq_scaling"], by_read["b"]["daq_offset"]) == (0.25, -100.0)
+    assert by_read["a"]["sampling_rate"] == 5_000.0
+
+
+def test_reused_requests_carry_the_new_chunk(wrapper):
+    basecall(wrapper, [(1, ReadData("a", signal(1_000), 0))])
+    assert basecall(wrapper, [(1, ReadData("a", signal(1_500), 0))]) == [(1, "a", True)]
+    basecall(wrapper, [(1, ReadData("c", signal(200), 7_000))])
+
+    first, second, third = RecordingClient.requests
+    assert len(first["raw_data"]) == 1_000
+    # the tail window overlaps the basecalled signal
+    np.testing.assert_array_equal(second["raw_data"], np.arange(900, 1_500, dtype=SIGNAL_DTYPE))
+    assert second["start_time"] == 900
+    assert (third["read_id"], third["start_time"], len(third["raw_data"])) == ("c", 7_000, 200)
+    assert third["daq_offset"] == -200.0
@@ -0,0 +1,93 @@
+from queue import Queue
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyfastx")
+
+import minster.estimator_manager as estimator_manager
+from minster.estimator_manager import EstimatorManager
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(estimator_manager.time, "monotonic", clock)
+    return clock
+
+
+def make_estimator(*expected_ratios: int) -> EstimatorManager:
+    catalog = [SimpleNamespace(expected_ratio=expected_ratio) for expected_ratio in expected_ratios]
+    return EstimatorManager(catalog, 1, 0, Queue())
+
+
+def receive(estimator: EstimatorManager, strata_id: int, reads: int) -> None:
+    for _ in range(reads):
+        estimator.update_estimated_received_bases(strata_id)
+
+
+def test_strata_are_compared_per_second_of_exposure(clock):
+    estimator = make_estimator(1, 1)
+    estimator.add_reads(np.array([0, 0, 1, 1]), np.array([1_000, 2_000, 1_000, 2_000]))
+    estimator.start_exposure(0)
+    clock.now += 50
+    estimator.start_exposure(1)
+    clock.now += 50
+
+    # the second stratum received half the reads in half the time
+    receive(estimator, 0, 100)
+    receive(estimator, 1, 50)
+    np.testing.assert_allclose(estimator.get_exposures(), [100, 50])
+    np.testing.assert_allclose(estimator.get_acceptance_rates(np.array([True, True])), [1, 1])
+
+    receive(estimator, 0, 100)
+    rates = estimator.get_acceptance_rates(np.array([True, True]))
+    assert rates[0] < 1
+    assert rates[1] == 1
+
+
+def test_exposure_starts_once(clock):
+    estimator = make_estimator(1, 1)
+    estimator.start_exposure(0)
+    clock.now += 10
+    estimator.start_exposure(0)
+
+    np.testing.assert_allclose(estimator.get_exposures(), [10, 0])
+
+
+def test_batches_merge_into_the_moments_of_all_reads():
+    rng = np.random.default_rng(3)
+    estimator = make_estimator(1, 1, 1)
+    strata_ids = rng.integers(0, 2, size=300)
+    read_lengths = rng.integers(200, 50_000, size=300)
+    for batch in np.array_split(np.arange(300), 7):
+        estimator.add_reads(strata_ids[batch], read_lengths[batch])
+
+    counts, means, squared_differences = estimator._log_moments
+    for strata_id in (0, 1):
+        log_lengths = np.log(read_lengths[strata_ids == strata_id])
+        assert counts[strata_id] == len(log_lengths)
+        assert means[strata_id] == pytest.approx(np.mean(log_lengths))
+        assert squared_differences[strata_id] == pytest.approx(np.sum((log_lengths - np.mean(log_lengths)) ** 2))
+    # a stratum without reads keeps empty moments
+    assert (counts[2], means[2], squared_differences[2]) == (0, 0, 0)
+
+
+def test_received_bases_follow_the_log_normal_mean():
+    estimator = make_estimator(1)
+    read_lengths = np.array([1_000, 4_000, 16_000])
+    estimator.add_reads(np.zeros(3, dtype=np.int64), read_lengths)
+    receive(estimator, 0, 10)
+
+    log_lengths = np.log(read_lengths)
+    expected_mean = np.exp(np.mean(log_lengths) + np.var(log_lengths, ddof=1) / 2)
+    np.testing.assert_allclose(estimator.get_estimated_bases_received(), [10 * expected_mean])
@@ -0,0 +1,103 @@
+import uuid
+
+import pytest
+
+import minster.fragment_collection as fragment_collection
+from minster.fragment_collection import FragmentCollection
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(fragment_collection.time, "monotonic", clock)
+    return clock
+
+
+def test_uuid_and_other_read_ids(clock):
+    fragments = FragmentCollection(retention=100, generations=4)
+    read_id = str(uuid.uuid4())
+    fragments.add_ejected(read_id)
+    fragments.add_ejected("not-a-uuid")
+
+    assert fragments.was_ejected(read_id)
+    assert fragments.was_ejected("not-a-uuid")
+    assert not fragments.was_ejected(str(uuid.uuid4()))
+    assert len(fragments) == 2
+
+
+def test_recent_ids_are_sealed_after_a_generation_span(clock):
+    fragments = FragmentCollection(retention=100, generations=4)
+    read_ids = [str(uuid.uuid4()) for _ in range(50)]
+    for read_id in read_ids[:40]:
+        fragments.add_ejected(read_id)
+
+    clock.now += 25
+    for read_id in read_ids[40:]:
+        fragments.add_ejected(read_id)
+
+    assert len(fragments._sealed) == 1
+    assert len(fragments._recent_ids) == 10
+    assert all(fragments.was_ejected(read_id) for read_id in read_ids)
+    assert len(fragments) == 50
+
+
+def test_generations_expire_after_the_retention(clock):
+    fragments = FragmentCollection(retention=100, generations=4)
+    old_read_id = str(uuid.uuid4())
+    fragments.add_ejected(old_read_id)
+
+    # sealed at the next ejection after a generation span, dropped once it is older than the retention
+    clock.now += 25
+    fragments.add_ejected(str(uuid.uuid4()))
+    assert fragments.was_ejected(old_read_id)
+
+    clock.now += 110
+    fragments.add_ejected(str(uuid.uuid4()))
+    assert not fragments.was_ejected(old_read_id)
+    # the id ejected in between is sealed now, the latest one is recent
+    assert len(fragments) == 2
+
+
+def test_exported_generations_keep_their_age(clock):
+    fragments = FragmentCollection(retention=100, generations=4)
+    old_read_id = str(uuid.uuid4())
+    fragments.add_ejected(old_read_id)
+    clock.now += 90
+    recent_read_id = str(uuid.uuid4())
+    fragments.add_ejected(recent_read_id)
+    state = fragments.export_state()
+
+    # the restoring process has a monotonic clock of its own
+    clock.now = 50.0
+    restored = FragmentCollection(retention=100, generations=4)
+    restored.restore_state(state)
+    assert restored.was_ejected(old_read_id)
+    assert restored.was_ejected(recent_read_id)
+    assert len(restored) == 2
+
+    # the old generation is 90 s into its 125 s lifetime
+    restored.add_ejected(str(uuid.uuid4()))
+    clock.now += 40
+    restored.add_ejected(str(uuid.uuid4()))
+    assert not restored.was_ejected(old_read_id)
+    assert restored.was_ejected(recent_read_id)
+
+
+def test_expired_generations_are_not_restored(clock):
+    fragments = FragmentCollection(retention=100, generations=4)
+    fragments.add_ejected(str(uuid.uuid4()))
+    state = fragments.export_state()
+
+    clock.now += 200
+    state["ejected_ages"] = state["ejected_ages"] + 200
+    restored = FragmentCollection(retention=100, generations=4)
+    restored.restore_state(state)
+    assert len(restored) == 0
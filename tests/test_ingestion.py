@@ -0,0 +1,186 @@
+from pathlib import Path
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyfastx")
+pytest.importorskip("mappy")
+
+from minster.checkpoint import Checkpointer
+from minster.config import CheckpointSettings, ReadProcessorSettings
+from minster.experiment_manager import ExperimentManager
+from minster.fragment_collection import FragmentCollection
+from minster.read_processor import ReadProcessor
+from simulation.fake_protocol_service import FakeProtocolService
+
+
+class RecordingProcessor:
+    """
+    Stands in for ReadProcessor, keeps what the experiment manager passes to it.
+    """
+    def __init__(self, processed_records: Optional[int], failing_read: Optional[str] = None):
+        self.processed_records = processed_records
+        self.failing_read = failing_read
+        self.reads: list[tuple[str, int]] = []
+        self.parsed: list[str] = []
+        self.released: list[str] = []
+
+    def claim_file(self, fastq_path: str) -> Optional[int]:
+        return self.processed_records
+
+    def release_file(self, fastq_path: str) -> None:
+        self.released.append(fastq_path)
+
+    def add_read(self, read, file_records: int) -> None:
+        if read.get_read_id() == self.failing_read:
+            raise RuntimeError(read.get_read_id())
+        self.reads.append((read.get_read_id(), file_records))
+
+    def add_parsed_file(self, fastq_path: str) -> None:
+        self.parsed.append(fastq_path)
+
+
+class FakeStrataBalancer:
+    def __init__(self):
+        self.state = {"warmed_up": np.array([True, False])}
+
+    def get_all_strata(self) -> range:
+        return range(2)
+
+    def is_warmed_up(self, strata_id: int) -> bool:
+        return bool(self.state["warmed_up"][strata_id])
+
+    def is_completed(self, strata_id: int) -> bool:
+        return False
+
+    def export_state(self) -> dict[str, np.ndarray]:
+        return dict(self.state)
+
+    def restore_state(self, state: dict[str, np.ndarray]) -> None:
+        self.state = {"warmed_up": state["warmed_up"]}
+
+
+class FakeCatalog:
+    files = [SimpleNamespace(content_hash="abc")]
+
+    def __iter__(self):
+        return iter([SimpleNamespace(name="stratum")])
+
+
+class FakeClassifier:
+    def __init__(self):
+        self.active: set[int] = set()
+
+    def activate_sequences(self, container_id: int) -> None:
+        self.active.add(container_id)
+
+
+class FakeRead(NamedTuple):
+    read_id: str
+    fastq_path: str
+
+    def get_read_id(self) -> str:
+        return self.read_id
+
+    def get_fastq_file_path(self) -> str:
+        return self.fastq_path
+
+    def get_sequence_length(self) -> int:
+        return 8
+
+
+def make_processor(classifier: FakeClassifier) -> ReadProcessor:
+    return ReadProcessor(
+        classifier,
+        FakeStrataBalancer(),
+        FragmentCollection(),
+        ReadProcessorSettings(batch_size=10, target_base_count=1_000)
+    )
+
+
+@pytest.fixture
+def fastq_path(tmp_path) -> str:
+    # {output_dir}/{experiment_id}/{sample_id}/{run}/fastq_pass/{file}
+    fastq_dir = tmp_path / "experiment" / "sample" / "run" / "fastq_pass"
+    fastq_dir.mkdir(parents=True)
+    path = fastq_dir / "reads_0.fastq"
+    path.write_text("".join(
+        f"@read{i} runid=run ch={i} start_time=2024-01-01T00:00:00+00:00\nACGTACGT\n+\nIIIIIIII\n"
+        for i in range(1, 6)
+    ))
+    return str(path)
+
+
+def make_manager(processor: RecordingProcessor) -> ExperimentManager:
+    return ExperimentManager(FakeProtocolService("/"), processor)
+
+
+def test_the_processed_records_of_a_file_are_skipped(fastq_path):
+    processor = RecordingProcessor(2)
+    make_manager(processor).parse_fastq_file(fastq_path)
+
+    assert processor.reads == [("read3", 3), ("read4", 4), ("read5", 5)]
+    assert processor.parsed == [fastq_path]
+
+
+def test_claimed_files_are_not_parsed(fastq_path):
+    processor = RecordingProcessor(None)
+    make_manager(processor).parse_fastq_file(fastq_path)
+
+    assert processor.reads == []
+    assert processor.parsed == []
+
+
+def test_the_claim_is_released_when_parsing_fails(fastq_path):
+    processor = RecordingProcessor(0, failing_read="read2")
+    with pytest.raises(RuntimeError):
+        make_manager(processor).parse_fastq_file(fastq_path)
+
+    assert processor.released == [fastq_path]
+    assert processor.parsed == []
+
+
+def test_resumed_processor_claims_partly_ingested_files():
+    classifier = FakeClassifier()
+    processor = make_processor(classifier)
+    processor.resume(["done.fastq"], {"partial.fastq": 3})
+
+    assert processor.claim_file("done.fastq") is None
+    assert processor.claim_file("partial.fastq") == 3
+    assert processor.claim_file("partial.fastq") is None
+    processor.release_file("partial.fastq")
+    assert processor.claim_file("partial.fastq") == 3
+    assert processor.claim_file("new.fastq") == 0
+    assert classifier.active == {0}
+
+
+def test_released_files_skip_the_queued_records():
+    processor = make_processor(FakeClassifier())
+    assert processor.claim_file("partial.fastq") == 0
+    processor.add_read(FakeRead("read1", "partial.fastq"), 1)
+    processor.add_read(FakeRead("read2", "partial.fastq"), 2)
+    processor.release_file("partial.fastq")
+
+    assert processor.claim_file("partial.fastq") == 2
+
+
+def test_checkpoints_keep_the_processed_records(tmp_path):
+    catalog = FakeCatalog()
+    balancer = FakeStrataBalancer()
+    fragments = FragmentCollection()
+    fragments.add_ejected("ejected")
+    checkpointer = Checkpointer(CheckpointSettings(path=tmp_path / "checkpoint.npz"), catalog, balancer, fragments)
+    checkpointer.save(["done.fastq"], {"partial.fastq": 3})
+
+    restored_balancer = FakeStrataBalancer()
+    restored_balancer.state = {"warmed_up": np.array([False, False])}
+    restored_fragments = FragmentCollection()
+    restored = Checkpointer(CheckpointSettings(path=tmp_path / "checkpoint.npz"), catalog, restored_balancer, restored_fragments)
+
+    assert restored.restore() == (["done.fastq"], {"partial.fastq": 3})
+    assert restored_balancer.is_warmed_up(0)
+    assert restored_fragments.was_ejected("ejected")
+    assert not Path(str(tmp_path / "checkpoint.npz") + ".partial").exists()
+
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+pytest.importorskip("pyfastx")
+
+from minster.classifiers.minimizer_sketch import MinimizerSketch
+from minster.config import MinimizerSketchSettings, ReferenceSequence
+from minster.reference_catalog import ReferenceCatalog
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def random_sequence(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+@pytest.fixture
+def references(tmp_path) -> list[str]:
+    rng = random.Random(7)
+    sequences = [random_sequence(rng, 5_000), random_sequence(rng, 5_000)]
+    for i, sequence in enumerate(sequences):
+        (tmp_path / f"reference_{i}.fasta").write_text(f">contig_{i}\n{sequence}\n")
+    return sequences
+
+
+@pytest.fixture
+def sketch(tmp_path, references) -> MinimizerSketch:
+    catalog = ReferenceCatalog([
+        ReferenceSequence(path=tmp_path / f"reference_{i}.fasta", expected_ratio=1) for i in range(len(references))
+    ])
+    return MinimizerSketch(MinimizerSketchSettings(k=15, w=10, min_hits=3), catalog)
+
+
+def test_chunks_hit_the_stratum_they_come_from(sketch, references):
+    hits = sketch.count_hits(references[0][1_000:1_400])
+
+    # every window of w k-mers has a minimizer
+    assert hits[0] >= (400 - 15 + 1) // 10
+    assert hits[1] == 0
+    assert sketch.candidates(references[0][1_000:1_400]) == {0}
+
+
+def test_minimizers_are_canonical(sketch, references):
+    reverse_chunk = references[1][2_000:2_400].translate(_COMPLEMENT)[::-1]
+
+    assert sketch.candidates(reverse_chunk) == {1}
+
+
+def test_unrelated_and_short_chunks_have_no_candidates(sketch):
+    assert sketch.candidates(random_sequence(random.Random(11), 400)) == set()
+    assert sketch.candidates("ACGT" * 3) == set()
+    assert sketch.candidates("N" * 400) == set()
+
+
+def test_chunks_spanning_both_strata(sketch, references):
+    chimera = references[0][:300] + references[1][-300:]
+
+    assert sketch.candidates(chimera) == {0, 1}
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("pybasecall_client_lib")
+
+from minster.dorado_wrapper import SignalWindow, SignalWindowPolicy
+
+
+def basecall(policy: SignalWindowPolicy, channel: int, read_id: str, accumulated_samples: int) -> SignalWindow:
+    window = policy.select(channel, read_id, accumulated_samples)
+    assert window is not None
+    policy.commit(channel, read_id, window)
+    return window
+
+
+def test_without_limits_the_whole_signal_is_sent():
+    policy = SignalWindowPolicy(None, None, None)
+
+    assert basecall(policy, 1, "read", 4_000) == SignalWindow(0, 4_000)
+    assert basecall(policy, 1, "read", 8_000) == SignalWindow(0, 8_000)
+
+
+def test_tail_windows_overlap_the_basecalled_signal():
+    policy = SignalWindowPolicy(500, None, None)
+
+    assert basecall(policy, 1, "read", 4_000) == SignalWindow(0, 4_000)
+    assert basecall(policy, 1, "read", 8_000) == SignalWindow(3_500, 8_000)
+    # a new read on the channel starts from the beginning
+    assert basecall(policy, 1, "next", 4_000) == SignalWindow(0, 4_000)
+
+
+def test_requests_are_capped():
+    policy = SignalWindowPolicy(None, 3_000, None)
+
+    assert basecall(policy, 1, "read", 4_000) == SignalWindow(1_000, 4_000)
+    assert basecall(policy, 1, "read", 5_000) == SignalWindow(2_000, 5_000)
+
+
+def test_reads_are_exhausted_by_their_budget():
+    policy = SignalWindowPolicy(0, None, 6_000)
+
+    assert basecall(policy, 1, "read", 4_000) == SignalWindow(0, 4_000)
+    # only the budget left is sent
+    assert basecall(policy, 1, "read", 10_000) == SignalWindow(8_000, 10_000)
+    assert policy.select(1, "read", 14_000) is None
+    assert basecall(policy, 2, "read", 4_000) == SignalWindow(0, 4_000)
+
+
+def test_progress_is_kept_until_a_window_is_committed():
+    policy = SignalWindowPolicy(500, None, None)
+    assert basecall(policy, 1, "read", 4_000) == SignalWindow(0, 4_000)
+
+    # the result of this window never came back, it is sent again with the new signal
+    assert policy.select(1, "read", 6_000) == SignalWindow(3_500, 6_000)
+    assert basecall(policy, 1, "read", 8_000) == SignalWindow(3_500, 8_000)
+    assert policy.select(1, "read", 9_000) == SignalWindow(7_500, 9_000)
@@ -0,0 +1,77 @@
+import random
+from queue import Queue
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyfastx")
+pytest.importorskip("mappy")
+
+from metrics.metrics_store import MetricsStore
+from minster.config import ReferenceSequence, StratumAssignmentSettings, WarmStartSettings
+from minster.reference_catalog import ReferenceCatalog
+from minster.strata_balancer import StrataBalancer
+
+
+@pytest.fixture
+def balancer(tmp_path) -> StrataBalancer:
+    rng = random.Random(3)
+    reference_dir = tmp_path / "references"
+    reference_dir.mkdir()
+    paths = [reference_dir / "reference_0.fasta", reference_dir / "reference_1.fasta"]
+    for i, path in enumerate(paths):
+        path.write_text(f">contig_{i}\n{''.join(rng.choice('ACGT') for _ in range(1_000))}\n")
+    catalog = ReferenceCatalog([ReferenceSequence(path=path, expected_ratio=1) for path in paths])
+    return StrataBalancer(catalog, [], 1, 1, 10, 0, StratumAssignmentSettings(), Queue())
+
+
+@pytest.fixture
+def prior_store_path(tmp_path) -> str:
+    # the earlier run read the same references from another directory
+    path = str(tmp_path / "previous-metrics.db")
+    store = MetricsStore(path)
+    for i, length in enumerate([1_000, 2_000, 4_000]):
+        store.record_basecalled_reads(f"read{i}", "/elsewhere/reference_0.fasta", length, "")
+    store.record_basecalled_reads("read3", "/elsewhere/reference_9.fasta", 1_000, "")
+    for i in range(100):
+        store.record_classified_reads(f"read{i}", "/elsewhere/reference_0.fasta", "")
+    store.close()
+    return path
+
+
+def test_prior_strata_are_matched_by_file_name(balancer, prior_store_path):
+    balancer.warm_start(WarmStartSettings(metrics_store=prior_store_path, prior_weight=0.5, ratio_estimates=True))
+    state = balancer.export_state()
+
+    np.testing.assert_array_equal(state["estimated_reads_received"], [50, 0])
+    # the bases are observed by this run only
+    np.testing.assert_array_equal(state["observed_bases"], [0, 0])
+
+
+def test_received_counts_are_seeded_only_for_ratio_estimates(balancer, prior_store_path):
+    balancer.warm_start(WarmStartSettings(metrics_store=prior_store_path, prior_weight=0.5))
+
+    np.testing.assert_array_equal(balancer.export_state()["estimated_reads_received"], [0, 0])
+
+
+def test_a_prior_without_matching_strata_is_rejected(balancer, tmp_path):
+    path = str(tmp_path / "unrelated-metrics.db")
+    store = MetricsStore(path)
+    store.record_basecalled_reads("read0", "/elsewhere/unrelated.fasta", 1_000, "")
+    store.close()
+
+    with pytest.raises(ValueError):
+        balancer.warm_start(WarmStartSettings(metrics_store=path))
+
+
+def test_ambiguous_file_names_are_not_matched(tmp_path, prior_store_path):
+    paths = []
+    for directory in ["a", "b"]:
+        (tmp_path / directory).mkdir()
+        paths.append(tmp_path / directory / "reference_0.fasta")
+        paths[-1].write_text(f">contig_{directory}\n{'ACGT' * 250}\n")
+    catalog = ReferenceCatalog([ReferenceSequence(path=path, expected_ratio=1) for path in paths])
+    balancer = StrataBalancer(catalog, [], 1, 1, 10, 0, StratumAssignmentSettings(), Queue())
+
+    with pytest.raises(ValueError):
+        balancer.warm_start(WarmStartSettings(metrics_store=prior_store_path))